@@ -197,7 +197,7 @@ def command_line_script():
     assert command == 'create'
 
     # prepare the .mol2 files with antechamber (ambertools), assign BCC charges if necessary
-    [lig.antechamber_prepare_mol2() for lig in ligands]
+    ties.ligand.run_concurrently(ligands, 'antechamber_prepare_mol2')
 
     # make atom names unique in each ligand
     [lig.correct_atom_names() for lig in ligands]
@@ -238,6 +238,11 @@ def command_line_script():
         # selected_pairs = lm.traveling_salesmen()
         selected_pairs = lm.kruskal()
 
+    # generate the .frcmod files with parmchk2 (ambertools) for the selected ligands
+    ties.ligand.run_concurrently([lig for pair in selected_pairs if pair.suptop is not None
+                                  for lig in (pair.ligA, pair.ligZ)],
+                                 'generate_frcmod')
+
     ##########################################################
     # ------------------   Ligand ----------------------------
     for pair in selected_pairs:
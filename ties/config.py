@@ -4,6 +4,8 @@ import sys
 import pathlib
 import subprocess
 import tempfile
+import functools
+import types
 from collections.abc import Iterable
 
 import csv
@@ -858,11 +860,13 @@ class Config:
         return self.workdir / 'mol2'
 
     @staticmethod
+    @functools.lru_cache(maxsize=None)
     def get_element_map():
         """
+        The file is read once, every Atom uses this map when its type is set.
+        The returned mapping is shared and read-only. The atom types and elements are interned.
 
-
-        :return:
+        :return: a dictionary that maps the atom types to their elements
         """
         # Get the mapping of atom types to elements
         element_map_filename = pathlib.Path(os.path.dirname(__file__)) / 'data' / 'element_atom_type_map.txt'
@@ -875,9 +879,9 @@ class Config:
             element, atom_types = line.split('=')
 
             for atom_type in atom_types.split():
-                element_map[atom_type.strip()] = element.strip()
+                element_map[sys.intern(atom_type.strip())] = sys.intern(element.strip())
 
-        return element_map
+        return types.MappingProxyType(element_map)
 
     # fixme - this should be determined at the location where it is relevant rather than here in the conf
     # antechamber parameters, by default compute AM1-BCC charges
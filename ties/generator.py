@@ -4,6 +4,7 @@ import copy
 import shutil
 import subprocess
 import math
+import functools
 from collections import OrderedDict
 from pathlib import Path
 import warnings
@@ -15,6 +16,9 @@ from ties.topology_superimposer import get_atoms_bonds_from_mol2, \
     superimpose_topologies, get_atoms_bonds_from_ac
 
 
+# residue names of the solvent and ions which are not restrained
+SOLVENT_RESNAMES = ('WAT', 'Na+', 'TIP3W', 'TIP3', 'HOH', 'SPC', 'TIP4P')
+
 
 def _merge_frcmod_section(ref_lines, other_lines):
     """
@@ -175,14 +179,20 @@ def join_frcmod_files(f1, f2, output_filepath):
     def write_frcmod(frcmod, filename):
         with open(filename, 'w') as FOUT:
             FOUT.write('GENERATED .frcmod by joining two .frcmod files' + os.linesep)
+            # one format string per record length, e.g. ANGLE: "%s \t%s \t%s\n"
+            record_formats = {}
             for sname, items in frcmod.items():
                 FOUT.write(f'{sname}' + os.linesep)
+                lines = []
                 for item in items:
-                    atom_types = item[0]
-                    FOUT.write(atom_types)
-                    numbers = ' \t'.join([str(n) for n in item[1:]])
-                    FOUT.write(' \t' + numbers)
-                    FOUT.write(os.linesep)
+                    fmt = record_formats.get(len(item))
+                    if fmt is None:
+                        fmt = '%s \t' + ' \t'.join(['%s'] * (len(item) - 1)) + os.linesep
+                        record_formats[len(item)] = fmt
+                    # atom types followed by the numbers, formatted in a single call
+                    lines.append(fmt % tuple(item))
+                # write the entire section at once
+                FOUT.write(''.join(lines))
                 # the ending line
                 FOUT.write(os.linesep)
 
@@ -235,7 +245,7 @@ def _correct_fep_tempfactor_single_top(fep_summary, source_pdb_filename, new_pdb
         else:
             raise Exception('This should never happen. It has to be one of the cases')
 
-    source_sys.save(new_pdb_filename, use_hetatoms=False)  # , file_format='PDB') - fixme?
+    source_sys.save(new_pdb_filename, use_hetatoms=False)
 
 
 def correct_fep_tempfactor(fep_summary, source_pdb_filename, new_pdb_filename, hybrid_topology=False):
@@ -282,7 +292,7 @@ def correct_fep_tempfactor(fep_summary, source_pdb_filename, new_pdb_filename, h
         else:
             raise Exception('This should never happen. It has to be one of the cases')
 
-    pmdpdb.save(str(new_pdb_filename), use_hetatoms=False, overwrite=True)  # , file_format='PDB') - fixme?
+    pmdpdb.save(str(new_pdb_filename), use_hetatoms=False, overwrite=True)
 
 
 def get_ligand_resname(filename):
@@ -435,8 +445,7 @@ def get_protein_net_charge(working_dir, protein_file, ambertools_tleap, leap_inp
     and might assign the wront net charge.
     """
     cwd = working_dir / 'prep' / 'prep_protein_to_find_net_charge'
-    if not cwd.is_dir():
-        cwd.mkdir()
+    cwd.mkdir(exist_ok=True)
 
     # copy the protein
     shutil.copy(working_dir / protein_file, cwd)
@@ -593,6 +602,38 @@ def rewrite_mol2_hybrid_top(file, single_top_atom_names):
     new_order_u.atoms.write(file)
 
 
+@functools.lru_cache(maxsize=None)
+def _read_template_cached(filepath, mtime_ns):
+    """
+    Read a template once. The modification time is part of the cache key
+    so that an edited template is read again.
+    """
+    return Path(filepath).read_text()
+
+
+def _read_template(filepath):
+    """
+    Return the text of the NAMD template, cached across the generated files.
+    """
+    filepath = Path(filepath)
+    return _read_template_cached(str(filepath), filepath.stat().st_mtime_ns)
+
+
+def _write_if_changed(filepath, content):
+    """
+    Write the text to the file unless the file already has exactly this content.
+    Avoids rewriting the same inputs when the generation is repeated.
+
+    :return: True if the file was written
+    """
+    filepath = Path(filepath)
+    if filepath.is_file() and filepath.read_text() == content:
+        return False
+
+    filepath.write_text(content)
+    return True
+
+
 def update_PBC_in_namd_input(namd_filename, new_pbc_box, structure_filename, constraint_lines=''):
     """
     fixme - rename this file since it generates the .eq files
@@ -605,13 +646,13 @@ def update_PBC_in_namd_input(namd_filename, new_pbc_box, structure_filename, con
     """
     assert len(new_pbc_box) == 3
 
-    reformatted_namd_in = open(namd_filename).read().format(
+    namd_file = Path(namd_filename)
+    reformatted_namd_in = namd_file.read_text().format(
         cell_x=new_pbc_box[0], cell_y=new_pbc_box[1], cell_z=new_pbc_box[2],
-        
         constraints=constraint_lines, output='test_output', structure=structure_filename)
 
     # write to the file
-    open(namd_filename, 'w').write(reformatted_namd_in)
+    _write_if_changed(namd_file, reformatted_namd_in)
 
 def create_constraint_files(original_pdb, output):
     '''
@@ -621,14 +662,15 @@ def create_constraint_files(original_pdb, output):
     :return:
     '''
     sys = parmed.load_file(str(original_pdb), structure=True)
+
     # for each atom, give the B column the right value
     for atom in sys.atoms:
         # ignore water
-        if atom.residue.name in ['WAT', 'Na+', 'TIP3W', 'TIP3', 'HOH', 'SPC', 'TIP4P']:
+        if atom.residue.name in SOLVENT_RESNAMES:
             continue
 
         # set each atom depending on whether it is a H or not
-        if atom.name.upper().startswith('H'):
+        if atom.name[:1] in ('H', 'h'):
             atom.bfactor = 0
         else:
             # restrain the heavy atom
@@ -660,10 +702,10 @@ conskcol  B
     else:
         cons = 'constraints  off'
 
-    min_namd_initialised = open(os.path.join(from_dir, filename)).read() \
-        .format(structure_name=structure_name, constraints=cons, **pbc_box)
+    min_namd_initialised = _read_template(Path(from_dir) / filename) \
+        .format_map(dict(structure_name=structure_name, constraints=cons, **pbc_box))
     out_name = 'eq0.conf'
-    open(os.path.join(to_dir, out_name), 'w').write(min_namd_initialised)
+    _write_if_changed(Path(to_dir) / out_name, min_namd_initialised)
 
 def generate_namd_prod(namd_prod, dst_dir, structure_name):
     '''
@@ -673,9 +715,9 @@ def generate_namd_prod(namd_prod, dst_dir, structure_name):
     :param structure_name:
     :return:
     '''
-    input_data = open(namd_prod).read()
-    reformatted_namd_in = input_data.format(output='sim1', structure_name=structure_name)
-    open(dst_dir, 'w').write(reformatted_namd_in)
+    input_data = _read_template(namd_prod)
+    reformatted_namd_in = input_data.format_map({'output': 'sim1', 'structure_name': structure_name})
+    _write_if_changed(dst_dir, reformatted_namd_in)
 
 
 def generate_namd_eq(namd_eq, dst_dir, structure_name, engine, protein):
@@ -688,7 +730,22 @@ def generate_namd_eq(namd_eq, dst_dir, structure_name, engine, protein):
     :param protein:
     :return:
     '''
-    input_data = open(namd_eq).read()
+    # the {} fields are filled with str.format, string.Template would clash with the Tcl $variables
+    input_data = _read_template(namd_eq)
+
+    # the constraints are the same for each equilibration step
+    if protein is not None:
+        cons = f"""
+        constraints  on
+        consexp  2
+        # use the same file for the position reference and the B column
+        consref  ../build/{structure_name}.pdb ;#need all positions
+        conskfile  ../build/cons.pdb
+        conskcol  B
+                """
+    else:
+        cons = 'constraints  off'
+
     for i in range(1,3):
 
         if i == 1:
@@ -739,32 +796,11 @@ langevinPistonDecay   25.0             # oscillation decay time. smaller value c
                                        # Equall or smaller than piston period
                 """
 
-        if protein is not None:
-            cons = f"""
-        constraints  on
-        consexp  2
-        # use the same file for the position reference and the B column
-        consref  ../build/{structure_name}.pdb ;#need all positions
-        conskfile  ../build/cons.pdb
-        conskcol  B
-                """
-        else:
-            cons = 'constraints  off'
-
         prev_output = 'eq{}'.format(i-1)
 
-        reformatted_namd_in = input_data.format(
-            constraints=cons, output='eq%d' % (i),
-            prev_output=prev_output, structure_name=structure_name, pressure=pressure, run=run)
-
-        next_eq_step_filename = dst_dir / ("eq%d.conf" % (i))
-        open(next_eq_step_filename, 'w').write(reformatted_namd_in)
-
-
-def redistribute_charges(mda):
-    """
-    Calculate the original charges in the matched component.
-    """
-
+        reformatted_namd_in = input_data.format_map({
+            'constraints': cons, 'output': 'eq%d' % (i),
+            'prev_output': prev_output, 'structure_name': structure_name, 'pressure': pressure, 'run': run})
 
-    return
+        next_eq_step_filename = Path(dst_dir) / ("eq%d.conf" % (i))
+        _write_if_changed(next_eq_step_filename, reformatted_namd_in)
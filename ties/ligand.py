@@ -3,6 +3,9 @@ import os
 import subprocess
 import shutil
 import logging
+import copy
+import threading
+import concurrent.futures
 from pathlib import Path
 
 import numpy as np
@@ -15,6 +18,14 @@ from ties.config import Config
 logger = logging.getLogger(__name__)
 
 
+class _IdentityMap(dict):
+    """
+    A renaming map in which any name that was not renamed maps to itself.
+    """
+    def __missing__(self, key):
+        return key
+
+
 class Ligand:
     """
     The ligand helper class. Helps to load and manage the different copies of the ligand file.
@@ -29,7 +40,13 @@ class Ligand:
     """
     LIG_COUNTER = 0
 
-    _USED_FILENAMES = set()
+    # internal name -> the path of the first ligand with that name
+    _USED_FILENAMES = {}
+    # guards _USED_FILENAMES and LIG_COUNTER when the ligands are created from several threads
+    _REGISTRY_LOCK = threading.Lock()
+
+    # antechamber file types of the formats that are converted to .mol2
+    _ACPREP_FILETYPES = {'.ac': 'ac', '.prep': 'prepi'}
 
     def __init__(self, ligand, config=None, save=True):
         """Constructor method
@@ -45,20 +62,25 @@ class Ligand:
         # internal name without an extension
         self.internal_name = self.original_input.stem
 
-        # ligand names have to be unique
-        if self.internal_name in Ligand._USED_FILENAMES and self.config.uses_cmd:
-            raise ValueError(f'ERROR: the ligand filename {self.internal_name} is not unique in the list of ligands. ')
-        else:
-            Ligand._USED_FILENAMES.add(self.internal_name)
+        with Ligand._REGISTRY_LOCK:
+            # ligand names have to be unique
+            if self.internal_name in Ligand._USED_FILENAMES and self.config.uses_cmd:
+                first_path = Ligand._USED_FILENAMES[self.internal_name]
+                raise ValueError(f'ERROR: the ligand filename {self.internal_name} is not unique in the list of '
+                                 f'ligands. It is used by {first_path} and {self.original_input}')
+            Ligand._USED_FILENAMES.setdefault(self.internal_name, self.original_input)
+
+            # internal index
+            # TODO - move to config
+            self.index = Ligand.LIG_COUNTER
+            Ligand.LIG_COUNTER += 1
+
+        # the last ParmEd structure loaded from self.current, emptied whenever self.current changes
+        self._structure_cache = {}
 
         # last used representative Path file
         self.current = self.original_input
 
-        # internal index
-        # TODO - move to config
-        self.index = Ligand.LIG_COUNTER
-        Ligand.LIG_COUNTER += 1
-
         self._renaming_map = None
         self.ligand_with_uniq_atom_names = None
 
@@ -77,14 +99,13 @@ class Ligand:
         Returns: the name of the original file, or of it was .prepi, a new filename with .mol2
         """
 
-        if self.current.suffix.lower() not in ('.ac', '.prep'):
+        # the antechamber file type, None for any other format
+        filetype = Ligand._ACPREP_FILETYPES.get(self.current.suffix.lower())
+        if filetype is None:
             return
 
-        filetype = {'.ac': 'ac', '.prep': 'prepi'}[self.current.suffix.lower()]
-
         cwd = self.config.lig_acprep_dir / self.internal_name
-        if not cwd.is_dir():
-            cwd.mkdir(parents=True, exist_ok=True)
+        cwd.mkdir(parents=True, exist_ok=True)
 
         # prepare the .mol2 files with antechamber (ambertools), assign BCC charges if necessary
         logger.debug(f'Antechamber: converting {filetype} to mol2')
@@ -110,13 +131,44 @@ class Ligand:
         self.current = new_current
         logger.debug(f'Converted .ac file to .mol2. The location of the new file: {self.current}')
 
+    @property
+    def current(self):
+        """
+        The file that currently represents this ligand.
+        """
+        return self._current
+
+    @current.setter
+    def current(self, path):
+        self._current = path
+        # the cached structure belongs to the previous file
+        self._structure_cache.clear()
+
+    def _load_current(self):
+        """
+        Load self.current with ParmEd, reusing the previous structure if the file has not changed.
+
+        The cache is emptied whenever self.current is reassigned or written by this class,
+        the modification time and the size only guard against other programs rewriting the file.
+
+        The returned structure is shared with the cache and must not be modified,
+        unless the cache is cleared as well (see removeDU_atoms), otherwise work on a copy.
+        """
+        stat = self.current.stat()
+        key = (str(self.current), stat.st_mtime_ns, stat.st_size)
+        structure = self._structure_cache.get(key)
+        if structure is None:
+            structure = parmed.load_file(str(self.current), structure=True)
+            self._structure_cache = {key: structure}
+        return structure
+
     def are_atom_names_correct(self):
         """
         Checks if atom names:
          - are unique
          - have a correct format "LettersNumbers" e.g. C17
         """
-        ligand = parmed.load_file(str(self.current), structure=True)
+        ligand = self._load_current()
         atom_names = [a.name for a in ligand.atoms]
 
         are_uniqe = len(set(atom_names)) == len(atom_names)
@@ -177,7 +229,10 @@ class Ligand:
 
         logger.debug(f'Ligand {self.internal_name} will have its atom names renamed. ')
 
-        ligand = parmed.load_file(str(self.current), structure=True)
+        # reuse the structure parsed by are_atom_names_correct,
+        # it is renamed in place so it no longer represents the file and is dropped from the cache
+        ligand = self._load_current()
+        self._structure_cache.clear()
 
         logger.debug(f'Atom names in the molecule ({self.original_input}/{self.internal_name}) are either not unique '
               f'or do not follow NameDigit format (e.g. C15). Renaming')
@@ -186,7 +241,7 @@ class Ligand:
         logger.debug(f'Rename map: {renaming_map}')
 
         # save the output here
-        os.makedirs(self.config.lig_unique_atom_names_dir, exist_ok=True)
+        self.config.lig_unique_atom_names_dir.mkdir(parents=True, exist_ok=True)
 
         ligand_with_uniq_atom_names = self.config.lig_unique_atom_names_dir / (self.internal_name + self.current.suffix)
         if self.save:
@@ -208,6 +263,14 @@ class Ligand:
 
     @property
     def rev_renaming_map(self):
+        """
+        Key: oldName, value: newName.
+
+        If no renaming took place, each name maps to itself without storing the names.
+        """
+        if self._renaming_map is None:
+            return _IdentityMap()
+
         return {b: c for c, b in self._renaming_map.items()}
 
     @renaming_map.setter
@@ -222,9 +285,12 @@ class Ligand:
             # For each renamed B value here, we have to find the A value
             # fixme: this works only if Bs are unique
 
-            # dict: C -> B. We know that C and B are unique. Therefore, reverse for convenience
-            rev_dict = {b: c for c, b in dict.items()}
-            self._renaming_map = {rev_dict[b]: a for b, a in self._renaming_map.items()}
+            # dict: C -> B. We know that C and B are unique, so C -> A is found in one pass
+            try:
+                self._renaming_map = {c: self._renaming_map[b] for c, b in dict.items()}
+            except KeyError as E:
+                raise ValueError(f'The intermediate atom name {E.args[0]} is not found '
+                                 f'in the previous renaming of {self.internal_name}') from E
 
     # make this into a python property
     def suffix(self):
@@ -295,21 +361,20 @@ class Ligand:
         They are only created if you reuse existing charges.
         They appear to be a side effect. We remove the dummy atoms therefore.
         """
-        mol2 = parmed.load_file(str(self.current), structure=True)
+        mol2 = self._load_current()
         # check if there are any DU atoms
-        has_DU = any(a.type == 'DU' for a in mol2.atoms)
-        if not has_DU:
+        is_DU = np.array([a.type for a in mol2.atoms]) == 'DU'
+        if not is_DU.any():
             return
 
+        # the structure is modified in place, so it no longer represents any cached file
+        self._structure_cache.clear()
+
         # make a backup copy before (to simplify naming)
         shutil.move(self.current, self.current.parent / ('lig.beforeRemovingDU' + self.current.suffix))
 
-        # remove DU type atoms and save the file
-        for atom in mol2.atoms:
-            if atom.name != 'DU':
-                continue
-
-            atom.residue.delete_atom(atom)
+        # remove DU type atoms in one call and save the file
+        mol2.strip(is_DU.tolist())
         # save the updated molecule
         mol2.save(str(self.current))
         logger.debug('Removed dummy atoms with type "DU"')
@@ -331,8 +396,7 @@ class Ligand:
 
         # prepare cwd
         cwd = self.config.lig_frcmod_dir / self.internal_name
-        if not cwd.is_dir():
-            cwd.mkdir(parents=True, exist_ok=True)
+        cwd.mkdir(parents=True, exist_ok=True)
 
         target_frcmod = f'{self.internal_name}.frcmod'
         log_filename = cwd / "parmchk2.log"
@@ -354,63 +418,96 @@ class Ligand:
         logger.debug(f'Parmchk2: created frcmod: {target_frcmod}')
         self.frcmod = cwd / target_frcmod
 
-    def overwrite_coordinates_with(self, file, output_file):
+    def overwrite_coordinates_with(self, file, output_file, match_by='name'):
         """
         Load coordinates from another file and overwrite the coordinates in the current file.
+
+        :param match_by: "name" matches the atoms by their names,
+            "index" matches them by their order after checking that the elements agree
+        :type match_by: str
         """
+        if match_by not in ('name', 'index'):
+            raise ValueError(f'Atoms can be matched by "name" or "index", not by "{match_by}"')
 
-        # load the current atoms with ParmEd
-        template = parmed.load_file(str(self.current), structure=True)
+        # load the current atoms with ParmEd, the copy is modified and saved to output_file
+        template = copy.copy(self._load_current())
 
         # load the file with the coordinates we want to use
         coords = parmed.load_file(str(file), structure=True)
 
-        # fixme: use the atom names
-        by_atom_name = True
-        by_index = False
-        by_general_atom_type = False
-
         # mol2_filename will be overwritten!
         logger.info(f'Writing to {self.current} the coordinates from {file}. ')
 
-        coords_sum = np.sum(coords.atoms.positions)
-
-        if by_atom_name and by_index:
-            raise ValueError('Cannot have both. They are exclusive')
-        elif not by_atom_name and not by_index:
-            raise ValueError('Either option has to be selected.')
-
-        if by_general_atom_type:
-            for mol2_atom in template.atoms:
-                found_match = False
-                for ref_atom in coords.atoms:
-                    if element_from_type[mol2_atom.type.upper()] == element_from_type[ref_atom.type.upper()]:
-                        found_match = True
-                        mol2_atom.position = ref_atom.position
-                        break
-                assert found_match, "Could not find the following atom in the original file: " + mol2_atom.name
-        if by_atom_name:
-            for mol2_atom in template.atoms:
-                found_match = False
-                for ref_atom in coords.atoms:
-                    if mol2_atom.name.upper() == ref_atom.name.upper():
-                        found_match = True
-                        mol2_atom.position = ref_atom.position
-                        break
-                assert found_match, "Could not find the following atom name across the two files: " + mol2_atom.name
-        elif by_index:
+        if match_by == 'name':
+            # map each atom name to its reference position, the first occurrence of a name is used
+            ref_positions = {}
+            for ref_atom, ref_position in zip(coords.atoms, coords.coordinates):
+                ref_positions.setdefault(ref_atom.name.upper(), ref_position)
+
+            new_positions = np.empty((len(template.atoms), 3))
+            for i, mol2_atom in enumerate(template.atoms):
+                atom_name = mol2_atom.name.upper()
+                assert atom_name in ref_positions, \
+                    "Could not find the following atom name across the two files: " + mol2_atom.name
+                new_positions[i] = ref_positions[atom_name]
+        else:
+            if len(coords.atoms) < len(template.atoms):
+                raise ValueError(f'Cannot match the atoms by index: {file} has {len(coords.atoms)} atoms, '
+                                 f'but {self.current} has {len(template.atoms)}')
+
+            element_map = Config.get_element_map()
             for mol2_atom, ref_atom in zip(template.atoms, coords.atoms):
-                atype = element_from_type[mol2_atom.type.upper()]
-                reftype = element_from_type[ref_atom.type.upper()]
+                atype = element_map[mol2_atom.type.upper()]
+                reftype = element_map[ref_atom.type.upper()]
                 if atype != reftype:
                     raise Exception(
                         f"The found general type {atype} does not equal to the reference type {reftype} ")
 
-                mol2_atom.position = ref_atom.position
+            new_positions = coords.coordinates[:len(template.atoms)]
 
-        if np.testing.assert_almost_equal(coords_sum, np.sum(mda_template.atoms.positions), decimal=2):
-            logger.debug('Different positions sums:', coords_sum, np.sum(mda_template.atoms.positions))
-            raise Exception('Copying of the coordinates did not work correctly')
+        # update all the coordinates at once
+        template.coordinates = new_positions
 
         # save the output file
-        mda_template.atoms.write(output_file)
\ No newline at end of file
+        template.save(str(output_file))
+
+
+def run_concurrently(ligands, method_name, max_workers=None, **kwargs):
+    """
+    Call the same Ligand method (e.g. "antechamber_prepare_mol2") for each ligand concurrently.
+
+    Each ligand works in its own directory so the ambertools subprocesses are independent,
+    the ligands therefore have to have unique names.
+    The keyword arguments update the configs once, before any method is called,
+    and the methods are then called without them.
+    Threads are sufficient as the time is spent in the subprocesses.
+    The first exception raised by any ligand is re-raised.
+
+    :param ligands: ligands to be processed, each ligand is processed once
+    :type ligands: list of :class:`Ligand`
+    :param method_name: the name of the Ligand method to be called
+    :type method_name: str
+    :param max_workers: the maximum number of concurrent calls, by default the number of CPUs
+    :type max_workers: int
+    """
+    # preserve the order but do not run the same ligand twice
+    unique_ligands = list(dict.fromkeys(ligands))
+
+    # the working directories are named after the ligands, so two ligands with one name would write the same files
+    ligands_by_name = {}
+    for lig in unique_ligands:
+        other = ligands_by_name.setdefault(lig.internal_name, lig)
+        if other is not lig:
+            raise ValueError(f'The ligands {other.original_input} and {lig.original_input} have the same name '
+                             f'{lig.internal_name} and cannot be processed concurrently')
+
+    # the ligands usually share one Config, so apply the settings once before the threads start
+    for config in {id(lig.config): lig.config for lig in unique_ligands}.values():
+        config.set_configs(**kwargs)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(getattr(lig, method_name)) for lig in unique_ligands]
+        return [future.result() for future in futures]
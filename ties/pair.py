@@ -111,8 +111,10 @@ class Pair():
         # TODO
         # ligZ_old_new_atomname_map
         new_mismatch_names = []
+        ligA_rev_renaming_map = self.ligA.rev_renaming_map
+        ligZ_rev_renaming_map = self.ligZ.rev_renaming_map
         for a, z in self.config.manually_mismatched_pairs:
-            new_names = (self.ligA.rev_renaming_map[a], self.ligZ.rev_renaming_map[z])
+            new_names = (ligA_rev_renaming_map[a], ligZ_rev_renaming_map[z])
             logger.debug(f'Selecting mismatching atoms. The mismatch {(a, z)}) was renamed to {new_names}')
             new_mismatch_names.append(new_names)
 
@@ -1,9 +1,16 @@
 """
 These tests focus on the Ligand
 """
+import os
+import shutil
+import concurrent.futures
+
+import numpy as np
 import parmed
+import pytest
 
-from ties.ligand import Ligand
+from ties.ligand import Ligand, run_concurrently
+from ties import Config
 
 
 
@@ -18,3 +25,125 @@ def test_correct_atom_names_HAY_renamed():
     lig = Ligand('data/l_HAY.mol2')
     lig.correct_atom_names()
     assert lig.are_atom_names_correct()
+
+
+def test_rev_renaming_map_without_renaming():
+    # atom names are correct, so no renaming takes place and each name maps to itself
+    lig = Ligand('data/ligq.mol2')
+    lig.correct_atom_names()
+    assert lig.renaming_map is None
+    assert lig.rev_renaming_map['C1'] == 'C1'
+
+
+def test_overwrite_coordinates_by_name(tmp_path):
+    # the .pdb lists the atoms in the reverse order with shifted coordinates, the names decide the match
+    mol2 = parmed.load_file('data/ligq.mol2', structure=True)
+    reversed_pdb = parmed.Structure()
+    for atom in reversed(mol2.atoms):
+        reversed_pdb.add_atom(parmed.Atom(name=atom.name, atomic_number=atom.atomic_number), 'MOL', 1)
+    reversed_pdb.coordinates = mol2.coordinates[::-1] + 1.5
+    reversed_pdb.save(str(tmp_path / 'shifted.pdb'))
+
+    lig = Ligand('data/ligq.mol2')
+    lig.overwrite_coordinates_with(tmp_path / 'shifted.pdb', tmp_path / 'out.mol2', match_by='name')
+
+    written = parmed.load_file(str(tmp_path / 'out.mol2'), structure=True)
+    assert [a.name for a in written.atoms] == [a.name for a in mol2.atoms]
+    assert np.allclose(written.coordinates, mol2.coordinates + 1.5, atol=1e-3)
+
+
+def test_overwrite_coordinates_by_index(tmp_path):
+    mol2 = parmed.load_file('data/ligq.mol2', structure=True)
+    mol2.coordinates = mol2.coordinates - 2.0
+    mol2.save(str(tmp_path / 'shifted.mol2'))
+
+    lig = Ligand('data/ligq.mol2')
+    lig.overwrite_coordinates_with(tmp_path / 'shifted.mol2', tmp_path / 'out.mol2', match_by='index')
+
+    written = parmed.load_file(str(tmp_path / 'out.mol2'), structure=True)
+    assert np.allclose(written.coordinates, mol2.coordinates, atol=1e-3)
+
+
+def test_overwrite_coordinates_by_index_too_few_atoms(tmp_path):
+    mol2 = parmed.load_file('data/ligq.mol2', structure=True)
+    mol2[':1@C1,C2'].save(str(tmp_path / 'partial.mol2'))
+
+    lig = Ligand('data/ligq.mol2')
+    with pytest.raises(ValueError):
+        lig.overwrite_coordinates_with(tmp_path / 'partial.mol2', tmp_path / 'out.mol2', match_by='index')
+
+
+def test_load_current_after_rewriting_the_same_path(tmp_path):
+    # rewrite the file twice with the same size and modification time,
+    # as a quick tool run could within the timestamp granularity
+    mol2 = parmed.load_file('data/ligq.mol2', structure=True)
+    path = tmp_path / 'lig.mol2'
+    mol2.save(str(path))
+    mtime = path.stat().st_mtime_ns
+
+    lig = Ligand(path)
+    assert lig._load_current().atoms[0].name == 'C1'
+
+    mol2.atoms[0].name = 'X1'
+    mol2.save(str(path), overwrite=True)
+    os.utime(path, ns=(mtime, mtime))
+    # the ligand is pointed at the rewritten file
+    lig.current = path
+    assert lig._load_current().atoms[0].name == 'X1'
+
+
+def test_load_current_after_removing_du_atoms(tmp_path):
+    mol2 = parmed.load_file('data/ligq.mol2', structure=True)
+    mol2.atoms[-1].type = 'DU'
+    path = tmp_path / 'lig.mol2'
+    mol2.save(str(path))
+
+    lig = Ligand(path)
+    assert len(lig._load_current().atoms) == len(mol2.atoms)
+
+    # the cached structure is stripped and saved to the same path
+    lig.removeDU_atoms()
+    reloaded = lig._load_current()
+    assert len(reloaded.atoms) == len(mol2.atoms) - 1
+    assert 'DU' not in {a.type for a in reloaded.atoms}
+
+
+def test_run_concurrently_ligands_with_the_same_name(tmp_path):
+    # the same file name in two directories gives both ligands the same name and working directory
+    for subdir in ('a', 'b'):
+        (tmp_path / subdir).mkdir()
+        shutil.copy('data/ligq.mol2', tmp_path / subdir / 'lig_same_name.mol2')
+    lig_a = Ligand(tmp_path / 'a' / 'lig_same_name.mol2')
+    lig_b = Ligand(tmp_path / 'b' / 'lig_same_name.mol2')
+
+    with pytest.raises(ValueError, match='same name'):
+        run_concurrently([lig_a, lig_b], 'antechamber_prepare_mol2')
+
+
+def test_run_concurrently_calls_each_ligand_once():
+    lig_hay = Ligand('data/l_HAY.mol2')
+    lig_q = Ligand('data/ligq.mol2')
+
+    assert run_concurrently([lig_hay, lig_q, lig_hay], 'are_atom_names_correct') == [False, True]
+
+
+def test_ligands_with_the_same_name_created_concurrently(tmp_path):
+    # only one of the ligands with the same name can be registered with a command line config
+    config = Config()
+    config.uses_cmd = True
+    paths = []
+    for i in range(8):
+        (tmp_path / str(i)).mkdir()
+        paths.append(tmp_path / str(i) / 'lig_created_concurrently.mol2')
+        shutil.copy('data/ligq.mol2', paths[-1])
+
+    def create(path):
+        try:
+            return Ligand(path, config=config)
+        except ValueError:
+            return None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        created = list(executor.map(create, paths))
+
+    assert sum(lig is not None for lig in created) == 1
@@ -10,9 +10,11 @@ import copy
 
 import pytest
 import json
+import networkx as nx
 from ties import Pair
 from ties import Config
-from ties.topology_superimposer import _superimpose_topologies, Atom, get_starting_configurations
+from ties.topology_superimposer import (_superimpose_topologies, _fundamental_cycles, _nodes_in_cycles, Atom, AtomPair,
+                                         get_starting_configurations)
 
 
 def test_2diff_atoms_cn(CN):
@@ -22,6 +24,17 @@ def test_2diff_atoms_cn(CN):
     assert len(suptop) == 2
 
 
+def test_atom_pair_eq(CN):
+    c, n = CN
+    c2, n2 = copy.deepcopy(CN)
+
+    # pairs wrapping the same atoms are equal, the atoms are equal only to themselves
+    assert AtomPair(c, n) == AtomPair(c, n)
+    assert len({AtomPair(c, n), AtomPair(c, n)}) == 1
+    assert AtomPair(c, n) != AtomPair(c2, n2)
+    assert c != c2
+
+
 def test_3diff_atoms_cno_right_start(CNO):
     CNO2 = copy.deepcopy(CNO)
 
@@ -266,4 +279,30 @@ def test_get_starting_configuration(indole_cl1, indole_cl2):
     starting_configurations = get_starting_configurations(indole_cl1, indole_cl2, fraction=0.1, filter_ring_c=True)
 
     # N-N, Cl1-Cl2, Cl2-Cl1
-    assert len(starting_configurations) == 3
\ No newline at end of file
+    assert len(starting_configurations) == 3
+
+
+def test_fundamental_cycles_same_as_networkx():
+    # naphthalene-like fused rings with a tail
+    g = nx.Graph()
+    nx.add_cycle(g, [0, 1, 2, 3, 4, 5])
+    nx.add_cycle(g, [4, 5, 6, 7, 8, 9])
+    g.add_edge(9, 10)
+
+    cycles = _fundamental_cycles(g.adj)
+    assert cycles == nx.cycle_basis(g)
+    assert len(cycles) == 2
+
+
+def test_nodes_in_cycles_same_as_cycle_basis():
+    # fused rings joined by a bridge to a third ring, with tails
+    g = nx.Graph()
+    nx.add_cycle(g, [0, 1, 2, 3, 4, 5])
+    nx.add_cycle(g, [4, 5, 6, 7, 8, 9])
+    g.add_edges_from([(9, 10), (10, 11), (11, 12)])
+    nx.add_cycle(g, [12, 13, 14, 15, 16])
+    g.add_edge(16, 17)
+
+    in_cycles = _nodes_in_cycles(g.adj)
+    assert in_cycles == {n for cycle in nx.cycle_basis(g) for n in cycle}
+    assert not in_cycles & {10, 11, 17}
@@ -3,8 +3,8 @@ The main module responsible for the superimposition.
 """
 import sys
 import os
-import hashlib
 import copy
+import bisect
 import itertools
 import math
 import random
@@ -16,8 +16,7 @@ import pathlib
 import re
 import warnings
 from typing import Dict, List, Set, Tuple
-from functools import reduce
-from collections import OrderedDict
+from collections import OrderedDict, Counter
 
 import MDAnalysis
 # suppress the warning coming from MDAnalysis' dependency Bio.Align
@@ -35,7 +34,16 @@ import ties.generator
 
 logger = logging.getLogger(__name__)
 
+
+def _isclose(a, b, atol=0):
+    # np.isclose (rtol=1e-05) for two scalar floats, without the overhead of creating arrays
+    return abs(a - b) <= atol + 1e-05 * abs(b)
+
+
 class Bond:
+    # the bonds are iterated in the innermost loops of the superimposition
+    __slots__ = ('atom', 'type')
+
     def __init__(self, atom, type):
         self.atom = atom
         self.type = type
@@ -46,10 +54,17 @@ class Bond:
 class Bonds(set):
 
     def without(self, atom):
-        return {bond for bond in self if bond.atom is not atom}
+        # a tuple in the iteration order, the bonds do not need hashing again
+        return tuple(bond for bond in self if bond.atom is not atom)
 
 class Atom:
     counter = 1
+    # incremented whenever any atom is moved, so that the cached RMSDs can be invalidated
+    positions_version = 0
+
+    # many atoms are created (and copied) during the superimposition
+    __slots__ = ('_original_name', '_id', '_name', '_type', 'element', '_resname', '_charge', '_original_charge',
+                 'resid', 'bonds', 'use_general_type', 'hash_value', '_unique_counter', '_position')
 
     def __init__(self, name, atom_type, charge=0, use_general_type=False):
         self._original_name = None
@@ -118,7 +133,8 @@ class Atom:
 
     @type.setter
     def type(self, atom_type):
-        self._type = atom_type.upper()
+        # interned, like the keys of the element map
+        self._type = sys.intern(atom_type.upper())
 
         # save the general type
         # fixme - ideally it would use the config class that would use the right mapping
@@ -133,8 +149,11 @@ class Atom:
 
     @position.setter
     def position(self, pos):
-        # switch the type to float32 for any coordinate work with MDAnalysis
-        self._position = np.array([pos[0], pos[1], pos[2]], dtype='float32')
+        # switch the type to float32 for any coordinate work with MDAnalysis,
+        # a float32 array (e.g. a row of the MDAnalysis positions) is used without a copy.
+        # The input coordinates (mol2/pdb) have at most 4 decimals, well within the float32 precision.
+        self._position = np.asarray(pos, dtype='float32')
+        Atom.positions_version += 1
 
     def is_hydrogen(self):
         if self.element == 'H':
@@ -156,20 +175,19 @@ class Atom:
         '''
         return self.charge + sum(bond.atom.charge for bond in self.bonds if bond.atom.is_hydrogen())
 
+    # atoms are equal only to themselves, which keeps the set/dict lookups cheap
+    __eq__ = object.__eq__
+
     def __hash__(self):
         # Compute the hash key once
         if self.hash_value is not None:
             return self.hash_value
 
-        m = hashlib.md5()
         # fixme - ensure that each node is characterised by its chemistry,
         # fixme - id might not be unique, so check before the input data
-        m.update(str(self.charge).encode('utf-8'))
-        # use the unique counter to distinguish between created atoms
-        m.update(str(self._unique_counter).encode('utf-8'))
-        # include the number of bonds
-        m.update(str(len(self.bonds)).encode('utf-8'))
-        self.hash_value = int(m.hexdigest(), 16)
+        # use the unique counter to distinguish between created atoms,
+        # and include the number of bonds
+        self.hash_value = hash((self.charge, self._unique_counter, len(self.bonds)))
         return self.hash_value
 
     def __str__(self):
@@ -186,7 +204,7 @@ class Atom:
         """
         Check if the atoms are of the same type and have a charge within the given absolute tolerance.
         """
-        if self.type == atom.type and np.isclose(self.charge, atom.charge, atol=atol):
+        if self.type == atom.type and _isclose(self.charge, atom.charge, atol=atol):
             return True
 
         return False
@@ -201,7 +219,7 @@ class Atom:
         if self.type != atom.type:
             return False
 
-        if not np.isclose(self.united_charge, atom.united_charge, atol=atol):
+        if not _isclose(self.united_charge, atom.united_charge, atol=atol):
             return False
 
         return True
@@ -218,11 +236,30 @@ class Atom:
 
         return False
 
+    @staticmethod
+    def pairwise_same_element(atoms_left, atoms_right):
+        """
+        Vectorised .same_element for every combination of the left and the right atoms.
+        """
+        elements_left = np.array([a.element for a in atoms_left])
+        elements_right = np.array([a.element for a in atoms_right])
+        return elements_left[:, None] == elements_right[None, :]
+
+    @staticmethod
+    def pairwise_same_type(atoms_left, atoms_right):
+        """
+        Vectorised .same_type for every combination of the left and the right atoms.
+        """
+        types_left = np.array([a.type for a in atoms_left])
+        types_right = np.array([a.type for a in atoms_right])
+        return types_left[:, None] == types_right[None, :]
+
 
 class AtomPair:
     """
     An atom pair for networkx.
     """
+    __slots__ = ('left_atom', 'right_atom', 'hash_value')
 
     def __init__(self, left_node, right_node):
         self.left_atom = left_node
@@ -231,14 +268,18 @@ class AtomPair:
         self.hash_value = self._gen_hash()
 
     def _gen_hash(self):
-        m = hashlib.md5()
-        m.update(str(hash(self.left_atom)).encode('utf-8'))
-        m.update(str(hash(self.right_atom)).encode('utf-8'))
-        return int(m.hexdigest(), 16)
+        return hash((hash(self.left_atom), hash(self.right_atom)))
 
     def __hash__(self):
         return self.hash_value
 
+    def __eq__(self, other):
+        # pairs wrapping the same two atoms are the same pair
+        if not isinstance(other, AtomPair):
+            return NotImplemented
+
+        return self.left_atom is other.left_atom and self.right_atom is other.right_atom
+
     def is_heavy_atom(self):
         if self.left_atom.element == 'H':
             return False
@@ -263,34 +304,40 @@ class SuperimposedTopology:
     # ID distributor for instances
     COUNTER = 0
 
+    # the GAFF2 types that differ only in the arbitrary direction of the bond, both orders
+    NONDIRECTIONAL_TYPE_PAIRS = frozenset(itertools.chain.from_iterable(
+        ((t1, t2), (t2, t1)) for t1, t2 in [('CC', 'CD'), ('CE', 'CF'), ('CP', 'CQ'),
+                                            ('PC', 'PD'), ('PE', 'PF'),
+                                            ('NC', 'ND')]))
+
     def __init__(self, topology1=None, topology2=None, parmed_ligA=None, parmed_ligZ=None):
         self.set_parmeds(parmed_ligA, parmed_ligZ)
 
         """
         @superimposed_nodes : a set of pairs of nodes that matched together
         """
-        matched_pairs = []
-
-        # TEST: with the list of matching nodes, check if each node was used only once,
-        # the number of unique nodes should be equivalent to 2*len(common_pairs)
-        all_matched_nodes = []
-        [all_matched_nodes.extend(list(pair)) for pair in matched_pairs]
-        assert len(matched_pairs) * 2 == len(all_matched_nodes)
-
-        # fixme don't allow for initiating with matching pairs, it's not used anyway
-
-        # todo convert to nx? some other graph theory package?
-        matched_pairs.sort(key=lambda pair: pair[0].name)
-        self.matched_pairs = matched_pairs
+        # the pairs are added with add_node_pair, which keeps them sorted by the left atom name
+        self.matched_pairs = []
+        # the left atom names of the matched pairs, in the same order, used to insert the new pairs
+        self._matched_pairs_names = []
         self.top1 = topology1
         self.top2 = topology2
         # create graph representation for both in networkx library, initially to track the number of cycles
         # fixme
 
         self.mirrors = []
+        # frozenset of the matched pairs of each mirror, to check quickly if a mirror is already added
+        self._mirror_keys = set()
         self.alternative_mappings = []
         # this is a set of all nodes rather than their pairs
-        self.nodes = set(all_matched_nodes)
+        self.nodes = set()
+        # id() of the nodes, checked without calling Atom.__hash__
+        self._node_ids = set()
+        # atom (left or right) -> its matched pair
+        self._atom_to_pair = {}
+        # 64 bit Bloom filter of the matched pairs (see _pair_bloom_bit),
+        # the pairs of a suptop can be contained in another only if its bits are too
+        self._pairs_bloom = 0
         self.nodes_added_log = []
 
         self.internal_ids = None
@@ -309,6 +356,18 @@ class SuperimposedTopology:
         self._removed_due_to_net_charge = []
         self._removed_because_unmatched_rings = []
         self._removed_because_diff_bonds = []  # the atoms pair uses a different bond
+        # (list lengths, names of the removed pairs), rebuilt when the removed lists grow
+        self._removed_name_index = None
+        # (Atom.positions_version, rmsd), reset when the matched pairs change
+        self._rmsd_cache = None
+        # the RMSD after aligning the MDAnalysis ligands by the matched pairs, reset when they or the ligands change
+        self._mcs_rmsd_cache = None
+        # (left, right) number of circles, and the circles, reset when the matched pairs change
+        self._circle_number_cache = None
+        self._circles_cache = None
+
+        # the cycles of the input topologies, computed once and shared with the copies
+        self._original_circles = None
 
         # save the cycles in the left and right molecules
         if self.top1 is not None and self.top2 is not None:
@@ -648,19 +707,19 @@ class SuperimposedTopology:
         Then, across the cycles, remove the nodes that join rings (double rings).
         """
         l_cycles, r_cycles = self.get_original_circles()
-        # remove any nodes that are shared between two cycles
-        for c1, c2 in itertools.combinations(l_cycles, r=2):
-            common = c1.intersection(c2)
-            for atom in common:
-                c1.remove(atom)
-                c2.remove(atom)
-
-        # same for r_cycles
-        for c1, c2 in itertools.combinations(r_cycles, r=2):
-            common = c1.intersection(c2)
-            for atom in common:
-                c1.remove(atom)
-                c2.remove(atom)
+        # remove any nodes that are shared between two cycles,
+        # find the cycles of each atom in one pass instead of intersecting every pair of cycles
+        for cycles in (l_cycles, r_cycles):
+            cycles_by_atom = {}
+            for cycle in cycles:
+                for atom in cycle:
+                    cycles_by_atom.setdefault(atom, []).append(cycle)
+
+            for atom, atom_cycles in cycles_by_atom.items():
+                # going through the pairs of cycles in order removes the atom from two cycles at a time,
+                # so an atom in an odd number of cycles stays in the last one
+                for cycle in atom_cycles[:len(atom_cycles) // 2 * 2]:
+                    cycle.remove(atom)
 
         self._nonoverlapping_l_cycles = l_cycles
         self._nonoverlapping_r_cycles = r_cycles
@@ -722,7 +781,8 @@ class SuperimposedTopology:
                 ringring_removed.append((l,r))
 
         if ringring_removed:
-            logger.debug(f'(ST{self.id}) Ring only matches ring filter, removed: {ringring_removed} with hydrogens {removed_h}')
+            logger.debug('(ST%s) Ring only matches ring filter, removed: %s with hydrogens %s',
+                         self.id, ringring_removed, removed_h)
         return ringring_removed, removed_h
 
     def is_or_was_matched(self, atom_name1, atom_name2):
@@ -735,19 +795,20 @@ class SuperimposedTopology:
         if self.contains_atom_name_pair(atom_name1, atom_name2):
             return True
 
-        # check if it was unmatched
-        unmatched_lists = [
-                            self._removed_because_disjointed_cc,
-                            # ignore the charges in this list
-                            [pair for pair, q in self._removed_due_to_net_charge],
-                            [pair for pair, q in self._removed_pairs_with_charge_difference]
-                           ]
-        for unmatched_list in unmatched_lists:
-            for atom1, atom2 in unmatched_list:
-                if atom1.name == atom_name1 and atom2.name == atom_name2:
-                    return True
-
-        return False
+        # check if it was unmatched, the pairs are only ever appended to the removed lists,
+        # so the index of their names is valid as long as the lengths do not change
+        index_key = (len(self._removed_because_disjointed_cc),
+                     len(self._removed_due_to_net_charge),
+                     len(self._removed_pairs_with_charge_difference))
+        if self._removed_name_index is None or self._removed_name_index[0] != index_key:
+            removed_pairs = itertools.chain(self._removed_because_disjointed_cc,
+                                            # ignore the charges in these lists
+                                            (pair for pair, q in self._removed_due_to_net_charge),
+                                            (pair for pair, q in self._removed_pairs_with_charge_difference))
+            removed_names = frozenset((atom1.name, atom2.name) for atom1, atom2 in removed_pairs)
+            self._removed_name_index = (index_key, removed_names)
+
+        return (atom_name1, atom_name2) in self._removed_name_index[1]
 
     def find_pair_with_atom(self, atom):
         for node1, node2 in self.matched_pairs:
@@ -765,16 +826,8 @@ class SuperimposedTopology:
 
         Note that some atoms were removed due to charges.
         """
-        unmatched_atoms = []
-        for node in self.top1:
-            if not self.contains_node(node):
-                unmatched_atoms.append(node)
-
-        for node in self.top2:
-            if not self.contains_node(node):
-                unmatched_atoms.append(node)
-
-        return unmatched_atoms
+        # self._node_ids is the set of the ids of the matched atoms
+        return [node for node in itertools.chain(self.top1, self.top2) if id(node) not in self._node_ids]
 
     def get_unique_atom_count(self):
         """
@@ -798,61 +851,56 @@ class SuperimposedTopology:
             # todo comment
             return self.rmsd()
 
+        # the MDAnalysis coordinates are never moved, so the RMSD only changes with the matched pairs
+        if not overwrite_original and self._mcs_rmsd_cache is not None:
+            return self._mcs_rmsd_cache
+
         ligA = self.mda_ligA
         ligB = self.mda_ligB
 
-        # back up
-        ligA_original_positions = ligA.atoms.positions[:]
-        ligB_original_positions = ligB.atoms.positions[:]
-
         # select the atoms for the MCS,
         # the following uses 0-based indexing
-        mcs_ligA_ids = [left.id for left, right in self.matched_pairs]
-        mcs_ligB_ids = [right.id for left, right in self.matched_pairs]
+        mcs_ids = np.fromiter(itertools.chain.from_iterable((left.id, right.id) for left, right in self.matched_pairs),
+                              dtype=np.int64, count=2 * len(self.matched_pairs)).reshape(-1, 2)
+        mcs_ligA_ids = mcs_ids[:, 0]
+        mcs_ligB_ids = mcs_ids[:, 1]
 
-        ligA_fragment = ligA.atoms[mcs_ligA_ids]
-        ligB_fragment = ligB.atoms[mcs_ligB_ids]
+        # work on copies of the coordinates (.positions returns a copy),
+        # so the MDAnalysis atoms never have to be moved and restored
+        ligA_positions = ligA.atoms.positions
+        ligB_positions = ligB.atoms.positions
 
         # move all to the origin of the fragment
-        ligA_mcs_centre = ligA_fragment.centroid()
-        ligA.atoms.translate(-ligA_mcs_centre)
-        ligB.atoms.translate(-ligB_fragment.centroid())
-
-        rotation_matrix, rmsd = MDAnalysis.analysis.align.rotation_matrix(ligB_fragment.positions, ligA_fragment.positions)
-
-        # apply the rotation to
-        ligB.atoms.rotate(rotation_matrix)
-        # move back to ligA
-        ligB.atoms.translate(ligA_mcs_centre)
-
-        # save the superimposed coordinates
-        ligB_sup = self.mda_ligB.atoms.positions[:]
+        ligA_mcs_centre = ligA.atoms[mcs_ligA_ids].centroid()
+        ligA_positions -= ligA_mcs_centre
+        ligB_positions -= ligB.atoms[mcs_ligB_ids].centroid()
 
-        # restore the MDAnalysis positions ("working copy")
-        # in theory you do not need to do this every time
-        self.mda_ligA.atoms.positions = ligA_original_positions
-        self.mda_ligB.atoms.positions = ligB_original_positions
+        rotation_matrix, rmsd = MDAnalysis.analysis.align.rotation_matrix(ligB_positions[mcs_ligB_ids],
+                                                                          ligA_positions[mcs_ligA_ids])
+        self._mcs_rmsd_cache = rmsd
 
         if not overwrite_original:
             # return the RMSD of the superimposed matched pairs only
             return rmsd
 
         # update the atoms with the mapping done via IDs
-        logger.debug(f'Aligned by MCS with the RMSD value {rmsd}')
+        logger.debug('Aligned by MCS with the RMSD value %s', rmsd)
+
+        # apply the rotation to ligB only when the coordinates are used, and move it back to ligA,
+        # in float32 like AtomGroup.rotate
+        ligB_sup = np.dot(ligB_positions, rotation_matrix.T.astype(np.float32))
+        ligB_sup += ligA_mcs_centre
 
         # use the aligned coordinates
         self.parmed_ligZ.coordinates = ligB_sup
 
         # ideally this would now be done with MDAnalysis which can now write .mol2
-        # overwrite the internal atom positions with the final generated alignment
-        for parmed_atom in self.parmed_ligZ.atoms:
-            found = False
-            for atom in self.top2:
-                if parmed_atom.idx == atom.id:
-                    atom.position = parmed_atom.xx, parmed_atom.xy, parmed_atom.xz
-                    found = True
-                    break
-            assert found
+        # overwrite the internal atom positions with the final generated alignment,
+        # each atom gets a row of the aligned float32 array
+        top2_by_id = {atom.id: atom for atom in self.top2}
+        for parmed_atom, position in zip(self.parmed_ligZ.atoms, ligB_sup):
+            assert parmed_atom.idx in top2_by_id
+            top2_by_id[parmed_atom.idx].position = position
 
         return rmsd
 
@@ -869,20 +917,25 @@ class SuperimposedTopology:
 
         # extract the bonds for the matched molecules first
         removed_pairs = []
-        for from_pair, bonded_pair_list in list(self.matched_pairs_bonds.items())[::-1]:
+        # the same pairs as a set for the membership checks
+        removed_pairs_set = set()
+        # iterate over a snapshot, the removal modifies the dictionary
+        for from_pair, bonded_pair_list in reversed(tuple(self.matched_pairs_bonds.items())):
             for bonded_pair, bond_type in bonded_pair_list:
                 # ignore if this combination was already checked
-                if bonded_pair in removed_pairs and from_pair in removed_pairs:
+                if bonded_pair in removed_pairs_set and from_pair in removed_pairs_set:
                     continue
 
                 if bond_type[0] != bond_type[1]:
                     # resolve this, remove the bonded pair from the matched atoms
-                    if from_pair not in removed_pairs:
+                    if from_pair not in removed_pairs_set:
                         self.remove_node_pair(from_pair)
                         removed_pairs.append(from_pair)
-                    if bonded_pair not in removed_pairs:
+                        removed_pairs_set.add(from_pair)
+                    if bonded_pair not in removed_pairs_set:
                         self.remove_node_pair(bonded_pair)
                         removed_pairs.append(bonded_pair)
+                        removed_pairs_set.add(bonded_pair)
 
                     # keep the history
                     self._removed_because_diff_bonds.append((from_pair, bonded_pair))
@@ -900,6 +953,7 @@ class SuperimposedTopology:
 
         # extract the bonds for the matched molecules first
         bonds = set()
+        matched_pairs = set(self.matched_pairs)
         for from_pair, bonded_pair_list in self.matched_pairs_bonds.items():
             from_pair_id = self.get_generated_atom_id(from_pair)
             for bonded_pair, bond_type in bonded_pair_list:
@@ -910,12 +964,11 @@ class SuperimposedTopology:
                         logger.error(f'ERROR: the bonded atoms are {bonded_pair}')
                         raise Exception('The bond types do not correspond to each other')
                 # every bonded pair has to be in the topology
-                assert bonded_pair in self.matched_pairs
+                assert bonded_pair in matched_pairs
                 to_pair_id = self.get_generated_atom_id(bonded_pair)
                 # before adding them to bonds, check if they are not already there
-                bond_sorted = sorted([from_pair_id, to_pair_id])
-                bond_sorted.append(bond_type[0])
-                bonds.add(tuple(bond_sorted))
+                low, high = (from_pair_id, to_pair_id) if from_pair_id <= to_pair_id else (to_pair_id, from_pair_id)
+                bonds.add((low, high, bond_type[0]))
 
         # extract the bond information from the unmatched
         unmatched_atoms = self.get_unmatched_atoms()
@@ -929,25 +982,34 @@ class SuperimposedTopology:
         # so the first iteration would take care of that,
         # the next iteration would connect SingleA2 to SingleA1, etc
         # first, remove the atoms that are connected to pairs
+        # map each matched atom to its pair once, rather than searching the pairs for every bond
+        atom_to_pair = {}
+        for pair in self.matched_pairs:
+            atom_to_pair[pair[0]] = pair
+            atom_to_pair[pair[1]] = pair
         for atom in unmatched_atoms:
+            unmatched_atom_id = self.get_generated_atom_id(atom)
             for bond in atom.bonds:
-                unmatched_atom_id = self.get_generated_atom_id(atom)
                 # check if the unmatched atom is bonded to any pair
-                pair = self.find_pair_with_atom(bond.atom)
+                pair = atom_to_pair.get(bond.atom)
                 if pair is not None:
                     # this atom is bound to a pair, so add the bond to the pair
                     pair_id = self.get_generated_atom_id(pair[0])
                     # add the bond between the atom and the pair
-                    bond_sorted = sorted([unmatched_atom_id, pair_id])
-                    bond_sorted.append(bond.type)
-                    bonds.add(tuple(bond_sorted))
+                    if unmatched_atom_id <= pair_id:
+                        low, high = unmatched_atom_id, pair_id
+                    else:
+                        low, high = pair_id, unmatched_atom_id
+                    bonds.add((low, high, bond.type))
                 else:
                     # it is not directly linked to a matched pair,
                     # simply add this missing bond to whatever atom it is bound
                     another_unmatched_atom_id = self.get_generated_atom_id(bond.atom)
-                    bond_sorted = sorted([unmatched_atom_id, another_unmatched_atom_id])
-                    bond_sorted.append(bond.type)
-                    bonds.add(tuple(bond_sorted))
+                    if unmatched_atom_id <= another_unmatched_atom_id:
+                        low, high = unmatched_atom_id, another_unmatched_atom_id
+                    else:
+                        low, high = another_unmatched_atom_id, unmatched_atom_id
+                    bonds.add((low, high, bond.type))
 
         # fixme - what about circles etc? these bonds
         # that form circles should probably be added while checking if the circles make sense etc
@@ -966,38 +1028,52 @@ class SuperimposedTopology:
         In the case of of equal length CCs, an arbitrary is chosen.
 
         How:
-        Generates the graph where each pair is a single node, connecting the nodes if the bonds exist.
-        Uses then networkx to find CCs.
+        Groups the pairs into CCs with union-find, connecting the pairs if the bonds exist.
+        Only if several CCs are left after comparing their sizes,
+        the graph where each pair is a single node is generated to compare the cycles with networkx.
         """
 
         if len(self) == 0:
             return self, []
 
-        def lookup_up(pairs, tuple_pair):
-            for pair in pairs:
-                if pair.is_pair(tuple_pair):
-                    return pair
+        # (left atom, right atom) -> AtomPair
+        atom_pairs = {(left, right): AtomPair(left, right) for left, right in self.matched_pairs}
+        pair_index = {pair: i for i, pair in enumerate(atom_pairs)}
 
-            raise Exception('Did not find the AtomPair')
+        # union-find (disjoint set) over the pair indices
+        parent = list(range(len(pair_index)))
+        rank = [0] * len(pair_index)
 
-        g = nx.Graph()
-        atom_pairs = []
-        for pair in self.matched_pairs:
-            ap = AtomPair(pair[0], pair[1])
-            atom_pairs.append(ap)
-            g.add_node(ap)
+        def find(i):
+            root = i
+            while parent[root] != root:
+                root = parent[root]
+            # path compression
+            while parent[i] != root:
+                parent[i], i = root, parent[i]
+            return root
 
         # connect the atom pairs
         for pair_from, pair_list in self.matched_pairs_bonds.items():
-            # lookup the corresponding atom pairs
-            ap_from = lookup_up(atom_pairs, pair_from)
+            root_from = find(pair_index[pair_from])
             for tuple_pair, bond_type in pair_list:
-                ap_to = lookup_up(atom_pairs, tuple_pair)
-                g.add_edge(ap_from, ap_to)
+                root_to = find(pair_index[tuple_pair])
+                if root_from == root_to:
+                    continue
+                # union by rank
+                if rank[root_from] < rank[root_to]:
+                    root_from, root_to = root_to, root_from
+                parent[root_to] = root_from
+                if rank[root_from] == rank[root_to]:
+                    rank[root_from] += 1
+
+        # check for connected components (CC), in the order of their first pair
+        components = {}
+        for pair, ap in atom_pairs.items():
+            components.setdefault(find(pair_index[pair]), []).append(ap)
 
-        # check for connected components (CC)
         remove_ccs = []
-        ccs = [g.subgraph(cc).copy() for cc in nx.connected_components(g)]
+        ccs = list(components.values())
         largest_cc = max([len(cc) for cc in ccs])
 
         # there are disjoint fragments, remove the smaller one
@@ -1008,7 +1084,7 @@ class SuperimposedTopology:
                 ccs.remove(cc)
 
         # remove the cc that have a smaller number of heavy atoms
-        largest_heavy_atom_cc = max([len([p for p in cc.nodes() if p.is_heavy_atom()])
+        largest_heavy_atom_cc = max([len([p for p in cc if p.is_heavy_atom()])
                                                         for cc in ccs])
         for cc in ccs[::-1]:
             if len([p for p in cc if p.is_heavy_atom()]) < largest_heavy_atom_cc:
@@ -1017,40 +1093,51 @@ class SuperimposedTopology:
                 remove_ccs.append(cc)
                 ccs.remove(cc)
 
-        # remove the cc that has a smaller number of rings
-        largest_cycle_num = max([len(nx.cycle_basis(cc)) for cc in ccs])
-        for cc in ccs[::-1]:
-            if len(nx.cycle_basis(cc)) < largest_cycle_num:
-                if verbose:
-                    logger.debug('Found CC that had fewer cycles. Removing. ')
-                remove_ccs.append(cc)
-                ccs.remove(cc)
-
-        # remove cc that has a smaller number of heavy atoms across rings
-        most_heavy_atoms_in_cycles = 0
-        for cc in ccs[::-1]:
-            # count the heavy atoms across the cycles
-            heavy_atom_counter = 0
-            for cycle in nx.cycle_basis(cc):
-                for a in cycle:
-                    if a.is_heavy_atom():
-                        heavy_atom_counter += 1
-            if heavy_atom_counter > most_heavy_atoms_in_cycles:
-                most_heavy_atoms_in_cycles = heavy_atom_counter
-
-        for cc in ccs[::-1]:
-            # count the heavy atoms across the cycles
-            heavy_atom_counter = 0
-            for cycle in nx.cycle_basis(cc):
-                for a in cycle:
-                    if a.is_heavy_atom():
-                        heavy_atom_counter += 1
-
-            if heavy_atom_counter < most_heavy_atoms_in_cycles:
-                if verbose:
-                    logger.debug('Found CC that had fewer heavy atoms in cycles. Removing. ')
-                remove_ccs.append(cc)
-                ccs.remove(cc)
+        if len(ccs) > 1:
+            # the cycles are compared next, which requires the graphs of the remaining CCs
+            g = nx.Graph()
+            g.add_nodes_from(atom_pairs.values())
+            for pair_from, pair_list in self.matched_pairs_bonds.items():
+                for tuple_pair, bond_type in pair_list:
+                    g.add_edge(atom_pairs[pair_from], atom_pairs[tuple_pair])
+            ccs = [g.subgraph(cc).copy() for cc in ccs]
+            # the cycles of each cc are used by both filters below, find them once
+            cc_cycles = {id(cc): _fundamental_cycles(cc.adj) for cc in ccs}
+
+            # remove the cc that has a smaller number of rings
+            largest_cycle_num = max([len(cc_cycles[id(cc)]) for cc in ccs])
+            for cc in ccs[::-1]:
+                if len(cc_cycles[id(cc)]) < largest_cycle_num:
+                    if verbose:
+                        logger.debug('Found CC that had fewer cycles. Removing. ')
+                    remove_ccs.append(cc)
+                    ccs.remove(cc)
+
+            # remove cc that has a smaller number of heavy atoms across rings
+            most_heavy_atoms_in_cycles = 0
+            for cc in ccs[::-1]:
+                # count the heavy atoms across the cycles
+                heavy_atom_counter = 0
+                for cycle in cc_cycles[id(cc)]:
+                    for a in cycle:
+                        if a.is_heavy_atom():
+                            heavy_atom_counter += 1
+                if heavy_atom_counter > most_heavy_atoms_in_cycles:
+                    most_heavy_atoms_in_cycles = heavy_atom_counter
+
+            for cc in ccs[::-1]:
+                # count the heavy atoms across the cycles
+                heavy_atom_counter = 0
+                for cycle in cc_cycles[id(cc)]:
+                    for a in cycle:
+                        if a.is_heavy_atom():
+                            heavy_atom_counter += 1
+
+                if heavy_atom_counter < most_heavy_atoms_in_cycles:
+                    if verbose:
+                        logger.debug('Found CC that had fewer heavy atoms in cycles. Removing. ')
+                    remove_ccs.append(cc)
+                    ccs.remove(cc)
 
         if len(ccs) > 1:
             # there are equally large CCs
@@ -1101,18 +1188,11 @@ class SuperimposedTopology:
         # for each atom that was not mapped to any other atom,
         # but is still in the topology, generate an ID for it
 
-        # find the not mapped atoms in the left topology and assign them an atom ID
-        for node in self.top1:
-            # check if this node was matched
-            if not self.contains_node(node):
-                self.internal_ids[node] = id_counter
-                id_counter += 1
-                self.unique_atom_count += 1
-
-        # find the not mapped atoms in the right topology and assign them an atom ID
-        for node in self.top2:
+        # find the not mapped atoms in the left and then the right topology and assign them an atom ID,
+        # self._node_ids is the set of the ids of the matched atoms
+        for node in itertools.chain(self.top1, self.top2):
             # check if this node was matched
-            if not self.contains_node(node):
+            if id(node) not in self._node_ids:
                 self.internal_ids[node] = id_counter
                 id_counter += 1
                 self.unique_atom_count += 1
@@ -1129,17 +1209,8 @@ class SuperimposedTopology:
         Return a list of appearing atoms (atomName) which are the
         atoms that are
         """
-        unmatched = []
-        for top2_atom in self.top2:
-            is_matched = False
-            for _, matched_right_ligand_atom in self.matched_pairs:
-                if top2_atom is matched_right_ligand_atom:
-                    is_matched = True
-                    break
-            if not is_matched:
-                unmatched.append(top2_atom)
-
-        return unmatched
+        matched_right = {right for _, right in self.matched_pairs}
+        return [top2_atom for top2_atom in self.top2 if top2_atom not in matched_right]
 
     def get_disappearing_atoms(self):
         """
@@ -1149,17 +1220,8 @@ class SuperimposedTopology:
         atoms that are found in the topology, and that
         are not present in the matched_pairs
         """
-        unmatched = []
-        for top1_atom in self.top1:
-            is_matched = False
-            for matched_left_ligand_atom, _ in self.matched_pairs:
-                if top1_atom is matched_left_ligand_atom:
-                    is_matched = True
-                    break
-            if not is_matched:
-                unmatched.append(top1_atom)
-
-        return unmatched
+        matched_left = {left for left, _ in self.matched_pairs}
+        return [top1_atom for top1_atom in self.top1 if top1_atom not in matched_left]
 
     def remove_lonely_hydrogens(self):
         """
@@ -1194,6 +1256,7 @@ class SuperimposedTopology:
     def set_tops(self, top1, top2):
         self.top1 = list(top1)
         self.top2 = list(top2)
+        self._original_circles = None
 
     def set_parmeds(self, ligA, ligZ):
         self.parmed_ligA = ligA
@@ -1201,6 +1264,7 @@ class SuperimposedTopology:
 
         self.mda_ligA = None
         self.mda_ligB = None
+        self._mcs_rmsd_cache = None
 
         if ligA is not None and ligZ is not None:
             # do not guess the masses
@@ -1224,31 +1288,21 @@ class SuperimposedTopology:
 
         This method is idempotent.
         """
-        nondirectionals = ({'CC', 'CD'}, {'CE', 'CF'}, {'CP', 'CQ'},
-                             {'PC', 'PD'}, {'PE', 'PF'},
-                             {'NC', 'ND'})
-
-        for no_direction_pair in nondirectionals:
-            corrected_pairs = []
-            for A1, A2 in self.matched_pairs:
-                # check if it is the right combination
-                if not {A1.type, A2.type} == no_direction_pair or (A1, A2) in corrected_pairs:
-                    continue
-
-                # ignore if they are already the same
-                if A2.type == A1.type:
-                    continue
-
-                # fixme - temporary solution
-                # fixme - do we want to check if we are in a ring?
-                # for now we are simply rewriting the types here so that it passes the "specific atom type" checks later
-                # ie so that later CC-CC and CD-CD are compared
-                # fixme - check if .type is used when writing the final output.
-                A2.type = A1.type
-                logger.debug(f'Arbitrary atom type correction. '
-                      f'Right atom type {A2.type} (in {A2}) overwritten with left atom type {A1.type} (in {A1}). ')
+        for A1, A2 in self.matched_pairs:
+            # check if it is the right combination,
+            # the types are never the same, so a corrected pair is not matched again
+            if (A1.type, A2.type) not in self.NONDIRECTIONAL_TYPE_PAIRS:
+                continue
 
-                corrected_pairs.append((A1, A2))
+            # fixme - temporary solution
+            # fixme - do we want to check if we are in a ring?
+            # for now we are simply rewriting the types here so that it passes the "specific atom type" checks later
+            # ie so that later CC-CC and CD-CD are compared
+            # fixme - check if .type is used when writing the final output.
+            A2.type = A1.type
+            logger.debug('Arbitrary atom type correction. '
+                         'Right atom type %s (in %s) overwritten with left atom type %s (in %s). ',
+                         A2.type, A2, A1.type, A1)
 
         return 0
 
@@ -1272,14 +1326,12 @@ class SuperimposedTopology:
               'sel right, name ' + '+'.join([node2.name.upper() for _, node2 in self.matched_pairs]))
         print(', '.join([a.name + '-' + b.name for a, b in self.matched_pairs]))
         print("Creation Order: ", self.nodes_added_log)
-        unique_nodes = []
-        for pair in self.matched_pairs:
-            unique_nodes.extend(list(pair))
 
+        matched_pairs = set(self.matched_pairs)
         for i, si_top in enumerate(self.mirrors, start=1):
             print('Mirror:', i)
             # print only the mismatching pairs
-            different = set(si_top.matched_pairs).difference(set(self.matched_pairs))
+            different = set(si_top.matched_pairs).difference(matched_pairs)
             print(different)
 
     def enforce_matched_atom_types_are_the_same(self):
@@ -1300,7 +1352,8 @@ class SuperimposedTopology:
             # get dangling hydrogens
 
             removed_hydrogens = self.remove_attached_hydrogens((a1, a2))
-            logger.debug(f'Removed earlier general-match general type:{a1}-{a2} with dangling hydrogens: {removed_hydrogens}')
+            logger.debug('Removed earlier general-match general type:%s-%s with dangling hydrogens: %s',
+                         a1, a2, removed_hydrogens)
 
     def get_net_charge(self):
         """
@@ -1315,8 +1368,11 @@ class SuperimposedTopology:
         Returns a list of matched atom pairs that have a different q,
         sorted in the descending order (the first pair has the largest q diff).
         """
-        diff_q = [(n1, n2) for n1, n2 in self.matched_pairs if np.abs(n1.united_charge - n2.united_charge) > 0]
-        return sorted(diff_q, key=lambda p: abs(p[0].united_charge - p[1].united_charge), reverse=True)
+        # the united charges sum the hydrogens, so compute each difference once
+        diff_q = [(abs(n1.united_charge - n2.united_charge), (n1, n2)) for n1, n2 in self.matched_pairs]
+        diff_q = [dq_pair for dq_pair in diff_q if dq_pair[0] > 0]
+        diff_q.sort(key=lambda dq_pair: dq_pair[0], reverse=True)
+        return [pair for _, pair in diff_q]
 
     def apply_net_charge_filter(self, net_charge_threshold):
         """
@@ -1507,10 +1563,29 @@ class SuperimposedTopology:
     def remove_node_pair(self, node_pair):
         assert len(node_pair) == 2, node_pair
         # remove the pair
-        self.matched_pairs.remove(node_pair)
+        if not self.contains(node_pair):
+            raise ValueError(f'The pair {node_pair} is not matched')
+        # the pairs are sorted by the left atom name, so find the first one with that name
+        pair_index = bisect.bisect_left(self._matched_pairs_names, node_pair[0].name)
+        while self.matched_pairs[pair_index] != node_pair:
+            pair_index += 1
+        del self.matched_pairs[pair_index]
+        del self._matched_pairs_names[pair_index]
+        self._rmsd_cache = None
+        self._mcs_rmsd_cache = None
+        self._circle_number_cache = None
+        self._circles_cache = None
+        del self._atom_to_pair[node_pair[0]]
+        del self._atom_to_pair[node_pair[1]]
         # remove from the current set
         self.nodes.remove(node_pair[0])
         self.nodes.remove(node_pair[1])
+        self._node_ids.remove(id(node_pair[0]))
+        self._node_ids.remove(id(node_pair[1]))
+        # the bits cannot be removed, so collect them again
+        self._pairs_bloom = 0
+        for pair in self.matched_pairs:
+            self._pairs_bloom |= self._pair_bloom_bit(pair)
 
         # update the log
         self.nodes_added_log.append(("Removed", node_pair))
@@ -1524,9 +1599,8 @@ class SuperimposedTopology:
             if bond_type[0] != bond_type[1]:
                 # fixme - this requires more attention
                 logger.debug('While removing a pair noticed that it has a different bond type')
-            # remove their binding to the removed pair
-            bound_pair_bonds = self.matched_pairs_bonds[bound_pair]
-            bound_pair_bonds.remove((node_pair, bond_type))
+            # remove their binding to the removed pair (the frozensets are replaced rather than changed)
+            self.matched_pairs_bonds[bound_pair] = self.matched_pairs_bonds[bound_pair] - {(node_pair, bond_type)}
 
     def remove_attached_hydrogens(self, node_pair):
         """
@@ -1553,7 +1627,7 @@ class SuperimposedTopology:
                 continue
 
             self.remove_node_pair(pair)
-            logger.debug(f'Removed dangling hydrogen pair: {pair}')
+            logger.debug('Removed dangling hydrogen pair: %s', pair)
             removed_pairs.append(pair)
         return removed_pairs
 
@@ -1563,15 +1637,17 @@ class SuperimposedTopology:
         that has the lowest RMSD. This way we increase the chance of getting a better match.
         However, long term it will be necessary to use the dihedrals to ensure that we match
         the atoms better.
+
+        Every mirror is evaluated: a lower bound such as the distance between the centroids
+        needs the same positions as the RMSD itself, which is cached per suptop anyway.
         """
         # fixme - you have to also take into account the "weird / other symmetries" besides mirrors
-        winner = self
-        lowest_rmsd = self.rmsd()
-        for mirror in self.mirrors:
-            mirror_rmsd = mirror.rmsd()
-            if mirror_rmsd < lowest_rmsd:
-                lowest_rmsd = mirror_rmsd
-                winner = mirror
+        candidates = [self] + self.mirrors
+        rmsds = [candidate.rmsd() for candidate in candidates]
+        # the first of the lowest, so a mirror has to be strictly better than self
+        winner_index = int(np.argmin(rmsds))
+        winner = candidates[winner_index]
+        lowest_rmsd = rmsds[winner_index]
 
         if self is winner:
             # False here means that it is not a mirror
@@ -1597,29 +1673,47 @@ class SuperimposedTopology:
 
         assert len(self.matched_pairs) > 0
 
-        dsts = []
-        for atomA, atomB in self.matched_pairs:
-            dst = np.sqrt(np.sum(np.square((atomA.position - atomB.position))))
-            dsts.append(dst)
-        return np.sqrt(np.mean(np.square(dsts)))
+        if self._rmsd_cache is not None and self._rmsd_cache[0] == Atom.positions_version:
+            return self._rmsd_cache[1]
+
+        # one (pair, side, xyz) array gathered in a single pass
+        positions = np.array([(atomA.position, atomB.position) for atomA, atomB in self.matched_pairs],
+                             dtype='float32')
+        # the squared distances are summed directly, without taking their roots first
+        deviations = positions[:, 0] - positions[:, 1]
+        rmsd = np.sqrt(np.einsum('ij,ij->', deviations, deviations) / len(deviations))
+        self._rmsd_cache = (Atom.positions_version, rmsd)
+        return rmsd
+
+    @staticmethod
+    def _pair_bloom_bit(node_pair):
+        # the ids are aligned to 16 bytes, so skip the lowest bits
+        return 1 << (((id(node_pair[0]) ^ id(node_pair[1])) >> 4) & 63)
 
     def add_node_pair(self, node_pair):
         # Argument: bonds are most often used to for parent, but it is a
         # set of "matched pairs"
 
         # fixme - use this function in the __init__ to initialise
-        assert node_pair not in self.matched_pairs, 'already added'
-        # check if a1 or a2 was used before
-        for a1, a2 in self.matched_pairs:
-            if node_pair[0] is a1 and node_pair[1] is a2:
-                raise Exception('already exists')
-        self.matched_pairs.append(node_pair)
-        self.matched_pairs.sort(key=lambda pair: pair[0].name)
+        assert self._atom_to_pair.get(node_pair[0]) != node_pair, 'already added'
+        # keep the pairs sorted by the left atom name (after the pairs with the same name)
+        pair_index = bisect.bisect_right(self._matched_pairs_names, node_pair[0].name)
+        self.matched_pairs.insert(pair_index, node_pair)
+        self._matched_pairs_names.insert(pair_index, node_pair[0].name)
+        self._rmsd_cache = None
+        self._mcs_rmsd_cache = None
+        self._circle_number_cache = None
+        self._circles_cache = None
+        self._atom_to_pair[node_pair[0]] = node_pair
+        self._atom_to_pair[node_pair[1]] = node_pair
         # update the list of unique nodes
         n1, n2 = node_pair
-        assert n1 not in self.nodes and n2 not in self.nodes, (n1, n2)
+        assert id(n1) not in self._node_ids and id(n2) not in self._node_ids, (n1, n2)
         self.nodes.add(n1)
         self.nodes.add(n2)
+        self._node_ids.add(id(n1))
+        self._node_ids.add(id(n2))
+        self._pairs_bloom |= self._pair_bloom_bit(node_pair)
         assert len(self.matched_pairs) * 2 == len(self.nodes)
 
         # update the log to understand the order in which this sup top was created
@@ -1627,8 +1721,9 @@ class SuperimposedTopology:
 
         # --------------------
         # update the bond information
-        # create a list of bonds for this pair
-        self.matched_pairs_bonds[node_pair] = set()
+        # create a list of bonds for this pair,
+        # the bonds are frozensets which are replaced on change so that the copies can share them
+        self.matched_pairs_bonds[node_pair] = frozenset()
 
     def link_pairs(self, from_pair, pairs):
         """
@@ -1640,9 +1735,9 @@ class SuperimposedTopology:
             assert pair in self.matched_pairs_bonds, f'not found pair {pair}'
 
             # link X-Y
-            self.matched_pairs_bonds[from_pair].add((pair, bond_types))
+            self.matched_pairs_bonds[from_pair] = self.matched_pairs_bonds[from_pair] | {(pair, bond_types)}
             # link Y-X
-            self.matched_pairs_bonds[pair].add((from_pair, bond_types))
+            self.matched_pairs_bonds[pair] = self.matched_pairs_bonds[pair] | {(from_pair, bond_types)}
 
     def link_with_parent(self, pair, parent, bond_type):
         assert len(pair) == 2
@@ -1653,41 +1748,56 @@ class SuperimposedTopology:
         assert parent in self.matched_pairs_bonds
 
         # link X-Y
-        self.matched_pairs_bonds[parent].add((pair, bond_type))
+        self.matched_pairs_bonds[parent] = self.matched_pairs_bonds[parent] | {(pair, bond_type)}
         # link Y-X
-        self.matched_pairs_bonds[pair].add((parent, bond_type))
+        self.matched_pairs_bonds[pair] = self.matched_pairs_bonds[pair] | {(parent, bond_type)}
 
     def __copy__(self):
         # https://stackoverflow.com/questions/1500718/how-to-override-the-copy-deepcopy-operations-for-a-python-object
-        new_one = type(self)()
+        # all attributes are taken over from self, so skip the __init__
+        new_one = object.__new__(type(self))
         new_one.__dict__.update(self.__dict__)
 
         # make a shallow copy of the arrays
-        new_one.matched_pairs = copy.copy(self.matched_pairs)
-        new_one.nodes = copy.copy(self.nodes)
-        new_one.nodes_added_log = copy.copy(self.nodes_added_log)
+        new_one.matched_pairs = self.matched_pairs.copy()
+        new_one._matched_pairs_names = self._matched_pairs_names.copy()
+        new_one.nodes = self.nodes.copy()
+        new_one._node_ids = self._node_ids.copy()
+        new_one._atom_to_pair = self._atom_to_pair.copy()
+        new_one.nodes_added_log = self.nodes_added_log.copy()
 
-        # copy the bond information
-        # improve
-        copied_bonds = {}
-        for pair, bonded_pairs_set in self.matched_pairs_bonds.items():
-            copied_bonds[pair] = copy.copy(bonded_pairs_set)
-        new_one.matched_pairs_bonds = copied_bonds
+        # copy the bond information, the frozensets of (pair, bond type) are replaced rather than changed,
+        # so they can be shared with the copy
+        new_one.matched_pairs_bonds = self.matched_pairs_bonds.copy()
 
         # copy the mirrors
-        new_one.mirrors = copy.copy(self.mirrors)
-        new_one.alternative_mappings = copy.copy(self.alternative_mappings)
+        new_one.mirrors = self.mirrors.copy()
+        new_one._mirror_keys = self._mirror_keys.copy()
+        new_one.alternative_mappings = self.alternative_mappings.copy()
 
         # make a shallow copy of the removed lists
-        new_one._removed_because_disjointed_cc = copy.copy(self._removed_because_disjointed_cc)
-        new_one._removed_pairs_with_charge_difference = copy.copy(self._removed_pairs_with_charge_difference)
-        new_one._removed_due_to_net_charge = copy.copy(self._removed_due_to_net_charge)
-        new_one._removed_because_unmatched_rings = copy.copy(self._removed_because_unmatched_rings)
-        new_one._removed_because_diff_bonds = copy.copy(self._removed_because_diff_bonds)
+        new_one._removed_because_disjointed_cc = self._removed_because_disjointed_cc.copy()
+        new_one._removed_pairs_with_charge_difference = self._removed_pairs_with_charge_difference.copy()
+        new_one._removed_due_to_net_charge = self._removed_due_to_net_charge.copy()
+        new_one._removed_because_unmatched_rings = self._removed_because_unmatched_rings.copy()
+        new_one._removed_because_diff_bonds = self._removed_because_diff_bonds.copy()
 
         # fixme - check any other lists that you keep track of
         return new_one
 
+    def __deepcopy__(self, memo):
+        """
+        Not a real deep copy: this is the same as __copy__.
+
+        The copy has its own matched pairs, mirrors and removal lists, but it shares the Atom objects,
+        the topologies and the parmed/MDAnalysis structures with the original (these cannot be deep copied).
+        Any change to the atoms themselves, e.g. redistribute_charges or setting a charge or a position,
+        is therefore visible in both the copy and the original.
+        """
+        new_one = self.__copy__()
+        memo[id(self)] = new_one
+        return new_one
+
     def find_mirror_choices(self):
         """
         For each pair (A1, B1) find all the other options in the mirrors where (A1, B2)
@@ -1762,41 +1872,36 @@ class SuperimposedTopology:
 
         # better matches
         # for each atom that mismatches, scan all molecules and find the best match and eliminate it
-        blacklisted_bxs = []
-        for _ in range(len(choices_mapping)):
-            # fixme - optimisation of this could be such that if they two atoms are within 0.2A or something
-            # then they are straight away fixed
-            closest_dst = 9999999
-            closest_a1 = None
-            closest_bx = None
-            for A1, choices in choices_mapping.items():
-                # so we have several choices for A1, and now naively we are taking the one that is closest, and
-                # assuming the superimposition is easy, this would work
-
-                # FIXME - you cannot use simply distances, if for A1 and A2 the best is BX, then BX there should be
-                # rules for that
-                for BX in choices:
-                    if BX in blacklisted_bxs:
-                        continue
-                    # use the distance_array because of PBC correction and speed
-                    a1_bx_dst = np.sqrt(np.sum(np.square(A1.position-BX.position)))
-                    if a1_bx_dst < closest_dst:
-                        closest_dst = a1_bx_dst
-                        closest_bx = BX
-                        closest_a1 = A1
+        # compute the distances between each A1 and all of its choices at once,
+        # the pairs that are not a choice are never picked
+        a1s = list(choices_mapping)
+        bxs = list(dict.fromkeys(itertools.chain.from_iterable(choices_mapping.values())))
+        bx_index = {BX: i for i, BX in enumerate(bxs)}
+        a1_positions = np.array([A1.position for A1 in a1s], dtype='float32').reshape(-1, 3)
+        bx_positions = np.array([BX.position for BX in bxs], dtype='float32').reshape(-1, 3)
+        is_choice = np.zeros((len(a1s), len(bxs)), dtype=bool)
+        for row, choices in enumerate(choices_mapping.values()):
+            is_choice[row, [bx_index[BX] for BX in choices]] = True
+
+        # fixme - optimisation of this could be such that if they two atoms are within 0.2A or something
+        # then they are straight away fixed
+        # so we have several choices for A1, and now naively we are taking the one that is closest, and
+        # assuming the superimposition is easy, this would work
+
+        # FIXME - you cannot use simply distances, if for A1 and A2 the best is BX, then BX there should be
+        # rules for that
+        for row, col, closest_dst in _greedy_closest_assignment(a1_positions, bx_positions, is_choice):
+            closest_a1 = a1s[row]
+            closest_bx = bxs[col]
 
             # across all the possible choices, found the best match now:
-            blacklisted_bxs.append(closest_bx)
             shortest_dsts.append(closest_dst)
-            logger.debug(f'{closest_a1.name} is matching best with {closest_bx.name}')
+            logger.debug('%s is matching best with %s', closest_a1.name, closest_bx.name)
 
             # remove the old tuple and insert the new one
             self.add_node_pair((closest_a1, closest_bx))
             added_nodes.add(closest_a1)
             added_nodes.add(closest_bx)
-            # remove from consideration
-            del choices_mapping[closest_a1]
-            # blacklist
 
         # fixme - check that the added and the removed nodes are the same set
         assert removed_nodes == added_nodes
@@ -1838,23 +1943,27 @@ class SuperimposedTopology:
         l_matched_circles, r_matched_circles = self.get_circles()
 
         # right now we are filtering out circles that are larger than 7 atoms,
-        l_circles = list(filter(lambda c: len(c) <= MAX_CIRCLE_SIZE, l_circles))
-        r_circles = list(filter(lambda c: len(c) <= MAX_CIRCLE_SIZE, r_circles))
-        l_matched_circles = list(filter(lambda c: len(c) <= MAX_CIRCLE_SIZE, l_matched_circles))
-        r_matched_circles = list(filter(lambda c: len(c) <= MAX_CIRCLE_SIZE, r_matched_circles))
+        l_circles = [c for c in l_circles if len(c) <= MAX_CIRCLE_SIZE]
+        r_circles = [c for c in r_circles if len(c) <= MAX_CIRCLE_SIZE]
+        l_matched_circles = [c for c in l_matched_circles if len(c) <= MAX_CIRCLE_SIZE]
+        r_matched_circles = [c for c in r_matched_circles if len(c) <= MAX_CIRCLE_SIZE]
 
         # first, see which matched circles eliminate themselves (simply matched circles)
         correct_circles = []
+        # index the right circles by their atoms, and look up the right atoms matched to each left circle
+        r_matched_circles_index = {frozenset(r_matched_circle): r_matched_circle
+                                   for r_matched_circle in r_matched_circles}
         for l_matched_circle in l_matched_circles[::-1]:
-            for r_matched_circle in r_matched_circles[::-1]:
-                if self.are_matched_sets(l_matched_circle, r_matched_circle):
-                    # These two circles fully overlap, so they are fine
-                    l_matched_circles.remove(l_matched_circle)
-                    r_matched_circles.remove(r_matched_circle)
-                    # update the original circles
-                    l_circles.remove(l_matched_circle)
-                    r_circles.remove(r_matched_circle)
-                    correct_circles.append((l_matched_circle, r_matched_circle))
+            matched_r_atoms = frozenset(self._atom_to_pair[atom][1] for atom in l_matched_circle)
+            r_matched_circle = r_matched_circles_index.pop(matched_r_atoms, None)
+            if r_matched_circle is not None:
+                # These two circles fully overlap, so they are fine
+                l_matched_circles.remove(l_matched_circle)
+                r_matched_circles.remove(r_matched_circle)
+                # update the original circles
+                l_circles.remove(l_matched_circle)
+                r_circles.remove(r_matched_circle)
+                correct_circles.append((l_matched_circle, r_matched_circle))
 
         # at this point, we should not have any matched circles, in either R and L
         # this is because we do not allow one ligand to have a matched circle, while another ligand not
@@ -1909,13 +2018,7 @@ class SuperimposedTopology:
         return removed_pairs
 
     def get_pair_with_atom(self, atom):
-        for a1, a2 in self.matched_pairs:
-            if a1 is atom:
-                return a1, a2
-            elif a2 is atom:
-                return a1, a2
-
-        return None
+        return self._atom_to_pair.get(atom)
 
     def get_topology_similarity_score(self):
         """
@@ -1948,17 +2051,13 @@ class SuperimposedTopology:
         that
         """
         overall_score = 0
+        # the same two atoms can neighbour several matched pairs, overlay them once
+        overlap_sizes = {}
         for node_a, node_b in self.matched_pairs:
             # for every neighbour in Left
             for a_bond in node_a.bonds:
                 # if this bonded atom is present in this superimposed topology (or component), ignore
-                # fixme - surely this can be done better, you could have "contains this atom or something"
-                in_this_sup_top = False
-                for other_a, _ in self.matched_pairs:
-                    if a_bond.atom == other_a:
-                        in_this_sup_top = True
-                        break
-                if in_this_sup_top:
+                if a_bond.atom in self._atom_to_pair:
                     continue
 
                 # a candidate is found that could make the node_a and node_b more similar,
@@ -1970,7 +2069,10 @@ class SuperimposedTopology:
                     # is enough to answer the question (because only charges were modified),
                     # however, this gets more tricky
                     # fixme - hardcoded
-                    score = len(_overlay(a_bond.atom, b_bond.atom))
+                    key = (a_bond.atom, b_bond.atom)
+                    if key not in overlap_sizes:
+                        overlap_sizes[key] = len(_overlay(a_bond.atom, b_bond.atom))
+                    score = overlap_sizes[key]
 
                     # this is a purely topology based score, the bigger the overlap the better the match
                     overall_score += score
@@ -1987,9 +2089,16 @@ class SuperimposedTopology:
 
         remove_dangling_h: After removing any pair it also removes any bound hydrogen(s).
         """
-        removed_hydrogen_pairs = []
-        for node1, node2 in self.matched_pairs[::-1]:
-            if node1.united_eq(node2, atol=atol) or (node1, node2) in removed_hydrogen_pairs:
+        removed_hydrogen_pairs = set()
+        # compare the types and the united charges of all the pairs at once (see Atom.united_eq)
+        pairs = list(self.matched_pairs)
+        united_charges_left = np.array([node1.united_charge for node1, node2 in pairs], dtype=float)
+        united_charges_right = np.array([node2.united_charge for node1, node2 in pairs], dtype=float)
+        same_type = np.array([node1.type == node2.type for node1, node2 in pairs], dtype=bool)
+        united_eq = same_type & np.isclose(united_charges_left, united_charges_right, atol=atol)
+        for pair_index in np.flatnonzero(~united_eq)[::-1]:
+            node1, node2 = pairs[pair_index]
+            if (node1, node2) in removed_hydrogen_pairs:
                 continue
 
             # remove this pair
@@ -2003,7 +2112,7 @@ class SuperimposedTopology:
 
             # Removed functionality: remove the dangling hydrogens
             removed_h_pairs = self.remove_attached_hydrogens((node1, node2))
-            removed_hydrogen_pairs.extend(removed_h_pairs)
+            removed_hydrogen_pairs.update(removed_h_pairs)
             for h_pair in removed_h_pairs:
                 self._removed_pairs_with_charge_difference.append(
                     (h_pair, 'dangling'))
@@ -2016,23 +2125,21 @@ class SuperimposedTopology:
     def is_consistent_cycles(self, suptop):
         # check if each sup top has the same number of cycles
         # fixme - not sure?
-        self_g1, self_g2 = self.get_nx_graphs()
-        self_cycles1, self_cycles2 = len(nx.cycle_basis(self_g1)), len(nx.cycle_basis(self_g2))
-        if self_cycles1 != self_cycles2:
+        if not self.same_circle_number():
             raise Exception('left G has a different number of cycles than right G')
 
-        other_g1, other_g2 = suptop.get_nx_graphs()
-        other_cycles1, other_cycles2 = len(nx.cycle_basis(other_g1)), len(nx.cycle_basis(other_g2))
-        if other_cycles1 != other_cycles2:
+        if not suptop.same_circle_number():
             raise Exception('left G has a different number of cycles than right G')
 
         # check if merging the two is going to create issues
         # with the circle inequality
-        # fixme - Optimise: reuse the above nx graphs rather than making an entire copy
-        self_copy = copy.copy(self)
-        # we ignore the parent here because it is only to check the number of circles
-        self_copy.merge(suptop)
-        if not self_copy.same_circle_number():
+        # count the circles of the merged atoms rather than merging a copy (see .merge)
+        for pair in suptop.matched_pairs:
+            if not self.contains(pair) and (self.contains_node(pair[0]) or self.contains_node(pair[1])):
+                raise Exception('already uses that node')
+        left_atoms = {nA for nA, nB in self.matched_pairs}.union(nA for nA, nB in suptop.matched_pairs)
+        right_atoms = {nB for nA, nB in self.matched_pairs}.union(nB for nA, nB in suptop.matched_pairs)
+        if self._count_circles(left_atoms) != self._count_circles(right_atoms):
             return False
 
         return True
@@ -2049,9 +2156,11 @@ class SuperimposedTopology:
         """
 
         # confirm that there is no mismatches, ie (A=B) in suptop1 and (A=C) in suptop2 where (C!=B)
-        for st1Na, st1Nb in self.matched_pairs:
-            for st2Na, st2Nb in suptop.matched_pairs:
-                if (st1Na is st2Na) and not (st1Nb is st2Nb) or (st1Nb is st2Nb) and not (st1Na is st2Na):
+        # ie each atom of a pair here is either unmatched in the other suptop or matched in the same pair
+        for pair in self.matched_pairs:
+            for atom in pair:
+                other_pair = suptop._atom_to_pair.get(atom)
+                if other_pair is not None and other_pair != pair:
                     return False
 
         # ensure there is at least one common pair
@@ -2064,6 +2173,19 @@ class SuperimposedTopology:
 
         return True
 
+    @staticmethod
+    def _split_atom_name(name):
+        """
+        Split the atom name after its last letter, e.g. C15 into ('C', '15').
+        Without any letters, the first part is empty.
+        """
+        # scan back from the end to the first letter
+        after_letters = len(name)
+        while after_letters > 0 and not name[after_letters - 1].isalpha():
+            after_letters -= 1
+
+        return name[:after_letters], name[after_letters:]
+
     @staticmethod
     def _rename_ligand(atoms, name_counter=None):
         """
@@ -2074,22 +2196,25 @@ class SuperimposedTopology:
         if name_counter is None:
             name_counter = {}
 
+        renamed = []
         for atom in atoms:
-            # get the first letters that is not a character
-            after_letters = [i for i, l in enumerate(atom.name) if l.isalpha()][-1] + 1
-
-            atom_name = atom.name[:after_letters]
+            # get the letters before the number
+            atom_name, _ = SuperimposedTopology._split_atom_name(atom.name)
             last_used_counter = name_counter.get(atom_name, 0)
 
             # rename
             last_used_counter += 1
             new_atom_name = atom_name + str(last_used_counter)
-            logger.info(f'Renaming {atom.name} to {new_atom_name}')
+            renamed.append(f'{atom.name}->{new_atom_name}')
             atom.name = new_atom_name
 
             # update the counter
             name_counter[atom_name] = last_used_counter
 
+        # one line for the whole ligand rather than one per atom
+        if renamed:
+            logger.info('Renaming %s', ', '.join(renamed))
+
         return name_counter
 
     @staticmethod
@@ -2102,11 +2227,9 @@ class SuperimposedTopology:
         name_counter = {}
 
         for atom in atoms:
-            # get the first letters that is not a character
-            after_letters = [i for i, l in enumerate(atom.name) if l.isalpha()][-1] + 1
-
-            atom_name = atom.name[:after_letters]
-            atom_number = int(atom.name[after_letters:])
+            # get the letters before the number
+            atom_name, atom_number = SuperimposedTopology._split_atom_name(atom.name)
+            atom_number = int(atom_number)
             last_used_counter = name_counter.get(atom_name, 0)
 
             # update the counter
@@ -2118,13 +2241,10 @@ class SuperimposedTopology:
     def _is_correct_atom_name_format(atoms):
         # check if the atom format is C15, ie atom name followed by a number
         for atom in atoms:
-            after_letters = [i for i, l in enumerate(atom.name) if l.isalpha()][-1] + 1
-
-            atom_name = atom.name[:after_letters]
+            atom_name, atom_number = SuperimposedTopology._split_atom_name(atom.name)
             if len(atom_name) == 0:
                 return False
 
-            atom_number = atom.name[after_letters:]
             try:
                 int(atom_number)
             except ValueError:
@@ -2153,7 +2273,7 @@ class SuperimposedTopology:
         r_atom_names = [a.name for a in r_nodes]
         r_names_unique = len(set(r_atom_names)) == len(r_atom_names)
         r_correct_format = SuperimposedTopology._is_correct_atom_name_format(r_nodes)
-        l_r_overlap = len(set(r_atom_names).intersection(set(l_atom_names))) > 0
+        l_r_overlap = not set(r_atom_names).isdisjoint(l_atom_names)
 
         if not r_names_unique or not r_correct_format or l_r_overlap:
             logger.info('Renaming Right Molecule Atom Names (Because it is needed)')
@@ -2164,68 +2284,114 @@ class SuperimposedTopology:
 
         return
 
-    def get_nx_graphs(self):
-        # maybe at some point this should be created and used internally more?
-        gl = nx.Graph()
-        gr = nx.Graph()
-        # add each node
-        for nA, nB in self.matched_pairs:
-            gl.add_node(nA)
-            gr.add_node(nB)
-        # add all the edges
+    def _get_matched_adjacency(self):
+        """
+        The adjacency (node -> {bonded node: None}) of the left and the right matched atoms.
+        The nodes and the edges are inserted in the same order as in get_nx_graphs.
+        """
+        adj_l = {nA: {} for nA, _ in self.matched_pairs}
+        adj_r = {nB: {} for _, nB in self.matched_pairs}
         for nA, nB in self.matched_pairs:
-            # add the edges from nA
             for nA_bonded in nA.bonds:
-                if nA_bonded.atom in gl:
-                    gl.add_edge(nA, nA_bonded.atom)
+                if nA_bonded.atom in adj_l:
+                    adj_l[nA][nA_bonded.atom] = None
+                    adj_l[nA_bonded.atom][nA] = None
             for nB_bonded in nB.bonds:
-                if nB_bonded.atom in gr:
-                    gr.add_edge(nB, nB_bonded.atom)
+                if nB_bonded.atom in adj_r:
+                    adj_r[nB][nB_bonded.atom] = None
+                    adj_r[nB_bonded.atom][nB] = None
+
+        return adj_l, adj_r
 
-        return gl, gr
+    def get_nx_graphs(self):
+        # the circles are found with the plain adjacency, the networkx graphs are only a view for the other uses
+        adj_l, adj_r = self._get_matched_adjacency()
+        return nx.Graph(adj_l), nx.Graph(adj_r)
 
     def get_circles(self):
         """
         Return circles found in the matched pairs.
         """
-        gl, gr = self.get_nx_graphs()
-        gl_circles = [set(circle) for circle in nx.cycle_basis(gl)]
-        gr_circles = [set(circle) for circle in nx.cycle_basis(gr)]
+        if self._circles_cache is None:
+            adj_l, adj_r = self._get_matched_adjacency()
+            self._circles_cache = ([frozenset(circle) for circle in _fundamental_cycles(adj_l)],
+                                   [frozenset(circle) for circle in _fundamental_cycles(adj_r)])
+
+        # the callers can modify the returned sets
+        gl_circles = [set(circle) for circle in self._circles_cache[0]]
+        gr_circles = [set(circle) for circle in self._circles_cache[1]]
         return gl_circles, gr_circles
 
     def get_original_circles(self):
         """
         Return the original circles present in the input topologies.
+        The input topologies do not change, so the cycles are computed once,
+        and each call returns new sets which can be modified.
         """
-        # create a circles
-        l_original = self._get_original_circle(self.top1)
-        r_original = self._get_original_circle(self.top2)
+        if self._original_circles is None:
+            # create a circles
+            l_original = self._get_original_circle(self.top1)
+            r_original = self._get_original_circle(self.top2)
+
+            self._original_circles = ([frozenset(circle) for circle in _fundamental_cycles(l_original)],
+                                      [frozenset(circle) for circle in _fundamental_cycles(r_original)])
 
-        l_circles = [set(circle) for circle in nx.cycle_basis(l_original)]
-        r_circles = [set(circle) for circle in nx.cycle_basis(r_original)]
+        l_circles = [set(circle) for circle in self._original_circles[0]]
+        r_circles = [set(circle) for circle in self._original_circles[1]]
         return l_circles, r_circles
 
     def _get_original_circle(self, atom_list):
-        """Create a networkx circle out of the list
+        """Create the adjacency (node -> {bonded node: None}) out of the list
         atom_list - list of AtomNode
         """
-        g = nx.Graph()
         # add each node
-        for atom in atom_list:
-            g.add_node(atom)
+        adjacency = {atom: {} for atom in atom_list}
 
-        # add all the edges
+        # add all the edges, following the bonds rather than checking every pair of atoms,
+        # the bonded atoms are visited in the order of atom_list so that the cycle basis is always the same
+        atom_index = {atom: i for i, atom in enumerate(atom_list)}
         for atom in atom_list:
             # add the edges from nA
-            for other in atom_list:
-                if atom.bound_to(other):
-                    g.add_edge(atom, other)
+            bonded = {bond.atom for bond in atom.bonds if bond.atom in atom_index}
+            for other in sorted(bonded, key=atom_index.get):
+                adjacency[atom][other] = None
+                adjacency[other][atom] = None
 
-        return g
+        return adjacency
+
+    @staticmethod
+    def _count_circles(atoms):
+        """
+        The number of circles in the cycle basis of the graph formed by the atoms and the bonds between them.
+        This is the number of edges - the number of nodes + the number of connected components,
+        which union-find gives without building the networkx graph.
+        """
+        parent = {atom: atom for atom in atoms}
+
+        def find(atom):
+            while parent[atom] is not atom:
+                parent[atom] = parent[parent[atom]]
+                atom = parent[atom]
+            return atom
+
+        edges = 0
+        components = len(parent)
+        for atom in parent:
+            for bonded in {bond.atom for bond in atom.bonds if bond.atom in parent}:
+                edges += 1
+                root, bonded_root = find(atom), find(bonded)
+                if root is not bonded_root:
+                    parent[root] = bonded_root
+                    components -= 1
+
+        # each bond was seen from both of its atoms
+        return edges // 2 - len(parent) + components
 
     def get_circle_number(self):
-        gl_circles, gr_circles = self.get_circles()
-        return len(gl_circles), len(gr_circles)
+        if self._circle_number_cache is None:
+            self._circle_number_cache = (self._count_circles([nA for nA, nB in self.matched_pairs]),
+                                         self._count_circles([nB for nA, nB in self.matched_pairs]))
+        return self._circle_number_cache
 
     def same_circle_number(self):
         gl_num, gr_num = self.get_circle_number()
@@ -2246,33 +2412,28 @@ class SuperimposedTopology:
         fixme - could this lead to a special case?
         """
 
-        for l_cycle in self._nonoverlapping_l_cycles:
-            overlap_counter = 0
-            for r_cycle in self._nonoverlapping_r_cycles:
-                # check if the cycles overlap
-                if self._cycles_overlap(l_cycle, r_cycle):
-                    overlap_counter += 1
+        # check once which left cycles overlap with which right cycles
+        overlaps = [[self._cycles_overlap(l_cycle, r_cycle) for r_cycle in self._nonoverlapping_r_cycles]
+                    for l_cycle in self._nonoverlapping_l_cycles]
 
-            if overlap_counter > 1:
+        # is any left cycle paired with more than one right cycle
+        for l_overlaps in overlaps:
+            if sum(l_overlaps) > 1:
                 return True
 
-        for r_cycle in self._nonoverlapping_r_cycles:
-            overlap_counter = 0
-            for l_cycle in self._nonoverlapping_l_cycles:
-                # check if the cycles overlap
-                if self._cycles_overlap(l_cycle, r_cycle):
-                    overlap_counter += 1
-
-            if overlap_counter > 1:
+        # is any right cycle paired with more than one left cycle
+        for r_overlaps in zip(*overlaps):
+            if sum(r_overlaps) > 1:
                 return True
 
         return False
 
     def _cycles_overlap(self, l_cycle, r_cycle):
-        # check if any nodes are paired across the two cycles
-        # any to any pairing
-        for left, right in itertools.product(l_cycle, r_cycle):
-            if self.contains((left, right)):
+        # check if any nodes are paired across the two cycles,
+        # ie if the partner of any left node is in the right cycle
+        for left in l_cycle:
+            pair = self._atom_to_pair.get(left)
+            if pair is not None and pair[1] in r_cycle:
                 return True
 
         return False
@@ -2321,12 +2482,12 @@ class SuperimposedTopology:
         - ensure that the total charge of L and R are integers
         - ensure that they are equal to the same integer
         """
-        whole_left_charge = sum(a.charge for a in atom_list_l)
+        whole_left_charge = float(np.sum([a.charge for a in atom_list_l]))
         np.testing.assert_almost_equal(whole_left_charge, round(whole_left_charge), decimal=2,
                                        err_msg=f'left charges are not integral. Expected {round(whole_left_charge)}'
                                                f' but found {whole_left_charge}')
 
-        whole_right_charge = sum(a.charge for a in atom_list_right)
+        whole_right_charge = float(np.sum([a.charge for a in atom_list_right]))
         np.testing.assert_almost_equal(whole_right_charge, round(whole_right_charge), decimal=2,
                                        err_msg=f'right charges are not integral. Expected {round(whole_right_charge)}'
                                                f' but found {whole_right_charge}'
@@ -2352,33 +2513,34 @@ class SuperimposedTopology:
         SuperimposedTopology.validate_charges(self.top1, self.top2)
 
         # find the integral net charge of the molecule
-        net_charge = round(sum(a.charge for a in self.top1))
-        net_charge_test = round(sum(a.charge for a in self.top2))
+        net_charge = round(float(np.sum([a.charge for a in self.top1])))
+        net_charge_test = round(float(np.sum([a.charge for a in self.top2])))
         if net_charge != net_charge_test:
             raise Exception('The internally computed net charges of the molecules are different')
         # fixme - use the one passed by the user?
         logger.debug(f'Internally computed net charge: {net_charge}')
 
-        # the total charge in the matched region before the changes
-        matched_total_charge_l = sum(left.charge for left, right in self.matched_pairs)
-        matched_total_charge_r = sum(right.charge for left, right in self.matched_pairs)
+        # the charges in the matched region before the changes, one (left, right) row per pair
+        matched_charges = np.array([(left.charge, right.charge) for left, right in self.matched_pairs],
+                                   dtype=float).reshape(-1, 2)
 
         # get the unmatched atoms in Left and Right
         l_unmatched = self.get_disappearing_atoms()
         r_unmatched = self.get_appearing_atoms()
 
-        init_q_dis = sum(a.charge for a in l_unmatched)
-        init_q_app = sum(a.charge for a in r_unmatched)
+        l_unmatched_charges = np.array([a.charge for a in l_unmatched], dtype=float)
+        r_unmatched_charges = np.array([a.charge for a in r_unmatched], dtype=float)
+        init_q_dis = l_unmatched_charges.sum()
+        init_q_app = r_unmatched_charges.sum()
         logger.debug(f'Initial cumulative charge of the appearing={init_q_app:.6f}, disappearing={init_q_dis:.6f} '
               f'alchemical regions')
 
         # average the charges between matched atoms in the joint area of the dual topology
-        total_charge_matched = 0    # represents the net charge of the joint area minus molecule charge
-        for left, right in self.matched_pairs:
-            avg_charge = (left.charge + right.charge) / 2.0
+        avg_charges = matched_charges.sum(axis=1) / 2.0
+        for (left, right), avg_charge in zip(self.matched_pairs, avg_charges.tolist()):
             # write the new charge
             left.charge = right.charge = avg_charge
-            total_charge_matched += avg_charge
+        total_charge_matched = avg_charges.sum()    # represents the net charge of the joint area minus molecule charge
         # total_partial_charge_matched e.g. -0.9 (partial charges) - -1 (net molecule charge) = 0.1
         total_partial_charge_matched = total_charge_matched - net_charge
         logger.debug(f'Total partial charge in the joint area = {total_partial_charge_matched:.6f}')
@@ -2415,14 +2577,16 @@ class SuperimposedTopology:
         logger.debug(f'Charge imbalance per atom in dis={l_delta_per_atom:.6f} and app={r_delta_per_atom:.6f}')
 
         # redistribute that delta q over the atoms in the left and right molecule
-        for atom in l_unmatched:
-            atom.charge += l_delta_per_atom
-        for atom in r_unmatched:
-            atom.charge += r_delta_per_atom
+        l_unmatched_charges += l_delta_per_atom
+        r_unmatched_charges += r_delta_per_atom
+        for atom, charge in zip(l_unmatched, l_unmatched_charges.tolist()):
+            atom.charge = charge
+        for atom, charge in zip(r_unmatched, r_unmatched_charges.tolist()):
+            atom.charge = charge
 
         # check if the appearing atoms and the disappearing atoms have the same net charge
-        dis_q_sum = sum(a.charge for a in l_unmatched)
-        app_q_sum = sum(a.charge for a in r_unmatched)
+        dis_q_sum = l_unmatched_charges.sum()
+        app_q_sum = r_unmatched_charges.sum()
         logger.debug(f'Final cumulative charge of the appearing={app_q_sum:.6f}, disappearing={dis_q_sum:.6f} '
               f'alchemical regions')
         if not np.isclose(dis_q_sum, app_q_sum):
@@ -2434,30 +2598,20 @@ class SuperimposedTopology:
 
     def contains_node(self, node):
         # checks if this node was used in this overlay
-        if node in self.nodes:
-            return True
-
-        return False
+        return id(node) in self._node_ids
 
     def count_common_nodes(self, node_list):
-        number_of_common_nodes = len(self.nodes.intersection(set(node_list)))
+        number_of_common_nodes = len(self.nodes.intersection(node_list))
         return number_of_common_nodes
 
     def count_common_node_pairs(self, other_suptop):
-        return len(set(self.matched_pairs).intersection(set(other_suptop.matched_pairs)))
+        return sum(1 for pair in self.matched_pairs if other_suptop.contains(pair))
 
     def contains_any_node_from(self, other_sup_top):
-        if len(self.nodes.intersection(other_sup_top.nodes)) > 0:
-            return True
-
-        return False
+        return not self.nodes.isdisjoint(other_sup_top.nodes)
 
     def contains(self, node_pair):
-        for match_pair in self.matched_pairs:
-            if match_pair == node_pair:
-                return True
-
-        return False
+        return self._atom_to_pair.get(node_pair[0]) == node_pair
 
     def contains_atom_name_pair(self, atom_name1, atom_name2):
         for m1, m2 in self.matched_pairs:
@@ -2497,23 +2651,22 @@ class SuperimposedTopology:
 
 
     def contains_all(self, other_sup_top):
-        for pair in other_sup_top.matched_pairs:
-            if not self.contains(pair):
-                return False
+        # a pair of the other suptop sets a bit that no pair here does
+        if other_sup_top._pairs_bloom & ~self._pairs_bloom:
+            return False
 
-        return True
+        # every atom of the other suptop is matched here in the same pair,
+        # the items views compare as sets with one lookup per atom
+        return other_sup_top._atom_to_pair.items() <= self._atom_to_pair.items()
 
     def contains_same_atoms_symmetric(self, other_sup_top):
         """
         The atoms can be paired differently, but they are the same.
         """
-        if len(self.nodes.symmetric_difference(other_sup_top.nodes)) == 0:
-            return True
-
-        return False
+        return self.nodes == other_sup_top.nodes
 
     def has_in_contrast_to(self, sup_top):
-        return set(self.matched_pairs).difference(set(sup_top.matched_pairs))
+        return {pair for pair in self.matched_pairs if not sup_top.contains(pair)}
 
     def report_differences(self, suptop):
         self_has_not_suptop = self.has_in_contrast_to(suptop)
@@ -2526,33 +2679,13 @@ class SuperimposedTopology:
         if len(self.matched_pairs) != len(other.matched_pairs):
             return False
 
-        for node1, _ in self.matched_pairs:
-            # check if each node exists in the other
-            node_found = False
-            for other_node, _ in other.matched_pairs:
-                if node1 == other_node:
-                    node_found = True
-
-            if not node_found:
-                return False
-
-        return True
+        return {left for left, _ in self.matched_pairs} == {left for left, _ in other.matched_pairs}
 
     def has_right_nodes_same_as(self, other):
         if len(self.matched_pairs) != len(other.matched_pairs):
             return False
 
-        for _, right_node in self.matched_pairs:
-            # check if each node exists in the other
-            node_found = False
-            for _, other_right in other.matched_pairs:
-                if right_node == other_right:
-                    node_found = True
-
-            if not node_found:
-                return False
-
-        return True
+        return {right for _, right in self.matched_pairs} == {right for _, right in other.matched_pairs}
 
     def is_subgraph_of(self, other_sup_top):
         """
@@ -2563,17 +2696,9 @@ class SuperimposedTopology:
         if len(self.matched_pairs) >= len(other_sup_top.matched_pairs):
             return False
 
-        # self is smaller, so it might be a subgraph
-        if other_sup_top.contains_all(self):
-            return True
-
-        # self is not a subgraph, but it could be a subgraph of one of the mirrors
-        for mirror in self.mirrors:
-            if other_sup_top.contains_all(mirror):
-                return True
-
-        # other is bigger than self, but not a subgraph of self
-        return False
+        # self is smaller, so it might be a subgraph,
+        # and if not, it could be a subgraph of one of the mirrors
+        return other_sup_top.contains_all(self) or any(other_sup_top.contains_all(mirror) for mirror in self.mirrors)
 
     def subgraph_relationship(self, other_sup_top):
         """
@@ -2636,18 +2761,22 @@ class SuperimposedTopology:
 
     def add_mirror_suptop(self, suptop):
         assert len(self.matched_pairs) == len(suptop.matched_pairs)
-        # check if this this mirror was already added
-        for mirror in self.mirrors:
-            if suptop.eq(mirror):
-                # a mirror like that already exists
-                return
+        # check if this this mirror was already added,
+        # ie if any mirror has the same pairs (see .eq)
+        key = frozenset(suptop.matched_pairs)
+        if key in self._mirror_keys:
+            # a mirror like that already exists
+            return
 
         # when you "absorb" another suptop as a mirror, extract its mirrors too
         self.mirrors.extend(suptop.mirrors)
+        self._mirror_keys.update(suptop._mirror_keys)
         suptop.mirrors = []
+        suptop._mirror_keys = set()
 
         # add the mirror
         self.mirrors.append(suptop)
+        self._mirror_keys.add(key)
 
     def eq(self, sup_top):
         """
@@ -2655,15 +2784,11 @@ class SuperimposedTopology:
         other topology (but possibly in a different order)
         """
         # fixme - should replace this with networkx
-        if len(self) != len(sup_top):
+        if len(self) != len(sup_top) or self._pairs_bloom != sup_top._pairs_bloom:
             return False
 
-        for pair in self.matched_pairs:
-            # find for every pair the matching pair
-            if not sup_top.contains(pair):
-                return False
-
-        return True
+        # find for every pair the matching pair, with the same size this means the same pairs
+        return sup_top.contains_all(self)
 
     def toJSON(self):
         """"
@@ -2704,9 +2829,18 @@ def get_largest(lists):
     """
     return a list of largest solutions
     """
-    solution_sizes = [len(st) for st in lists]
-    largest_sol_size = max(solution_sizes)
-    return list(filter(lambda st: len(st) == largest_sol_size, lists))
+    # one pass, keep the solutions of the largest size seen so far
+    largest_sol_size = -1
+    largest = []
+    for st in lists:
+        size = len(st)
+        if size > largest_sol_size:
+            largest_sol_size = size
+            largest = [st]
+        elif size == largest_sol_size:
+            largest.append(st)
+
+    return largest
 
 
 def long_merge(suptop1, suptop2):
@@ -2862,6 +2996,38 @@ def merge_compatible_suptops_faster(pairing_suptop: Dict, min_bonds: int):
     return built_topologies
 
 
+def _one_to_one_pairings(left_keys, right_keys, size):
+    """
+    Generate the combinations of (left, right) pairs of the given size
+    in which no left and no right key is used twice.
+
+    The order is the same as filtering
+    itertools.combinations(itertools.product(left_keys, right_keys), size),
+    but the impossible combinations are never created.
+    """
+    used_right = set()
+    chosen = []
+
+    def extend(start):
+        if len(chosen) == size:
+            yield tuple(chosen)
+            return
+
+        # the pairs are ordered by the left key, so every next pair uses a later left key
+        for li in range(start, len(left_keys) - (size - len(chosen)) + 1):
+            for right_key in right_keys:
+                if right_key in used_right:
+                    continue
+
+                used_right.add(right_key)
+                chosen.append((left_keys[li], right_key))
+                yield from extend(li + 1)
+                chosen.pop()
+                used_right.remove(right_key)
+
+    return extend(0)
+
+
 def solve_one_combination(one_atom_species, ignore_coords):
     atoms = one_atom_species
     if len(atoms) == 1:
@@ -2893,19 +3059,11 @@ def solve_one_combination(one_atom_species, ignore_coords):
         left_ligand_keys = list(atoms.keys())
         right_ligand_keys = list(unique_atoms)
 
-        # generate all pairs first
-        # fixme - this should be moved up?
-        # fixme - these functions should be factored out and tested separately
-        all_pairs = list(itertools.product(left_ligand_keys, right_ligand_keys))
         # if the left ligand can only match 2 atoms but the right 3 atoms,
         # then the best possible match is that of 2 pairs
         longest_match = min(len(left_ligand_keys), len(right_ligand_keys))
-        # generate all possible combinations
-        all_combinations = list(itertools.combinations(all_pairs, longest_match))
-        # filter out the ones that are impossible
-        chosen = list(filter(lambda s: len({pair[0] for pair in s}) == longest_match
-                             and len({pair[1] for pair in s}) == longest_match,
-                             all_combinations))
+        # generate only the possible combinations, ie where no atom is used twice
+        chosen = list(_one_to_one_pairings(left_ligand_keys, right_ligand_keys, longest_match))
 
         # fixme - use itertools instead?
 
@@ -2980,49 +3138,32 @@ def _overlay(n1, n2, parent_n1, parent_n2, bond_types, suptop, ignore_coords=Fal
     """
 
     # ignore if either of the nodes is part of the suptop
-    if suptop.contains_node(n1) or suptop.contains_node(n2):
+    # (inlined suptop.contains_node, this is the hottest check of the search)
+    if id(n1) in suptop._node_ids or id(n2) in suptop._node_ids:
         return None
 
-    if use_element_type and not n1.same_element(n2):
+    # the elements and the types are interned strings (see Atom.type),
+    # so comparing the identity is the same as Atom.same_element/same_type without the method calls
+    if use_element_type and n1.element is not n2.element:
         return None
 
     # make more specific, ie if "use_specific_type"
-    if not use_element_type and not n1.same_type(n2):
+    if not use_element_type and n1.type is not n2.type:
         return None
    
     # Check for cycles
     # if a new cycle is created by adding this node,
-    # then the cycle should be present in both, left and right ligand
-    safe = True
-    # if n1 is linked with node in suptop other than parent
-    for b1 in n1.bonds:
-        # if this bound atom is not a parent and is already a suptop
-        if b1.atom != parent_n1 and suptop.contains_node(b1.atom):
-            safe = False  # n1 forms cycle, now need to check n2
-            for b2 in n2.bonds:
-                if b2.atom != parent_n2 and suptop.contains_node(b2.atom):
-                    # b2 forms cycle, now need to check it's the same in both
-                    if suptop.contains((b1.atom, b2.atom)):
-                        safe = True
-                        break
-            if not safe:  # only n1 forms a cycle
-                break
-    if not safe:  # either only n1 forms cycle or both do but different cycles
-        return None
-    
-    # now the same for any remaining unchecked bonds in n2
-    safe = True
-    for b2 in n2.bonds:
-        if b2.atom != parent_n2 and suptop.contains_node(b2.atom):
-            safe = False
-            for b1 in n1.bonds:
-                if b1.atom != parent_n1 and suptop.contains_node(b1.atom):
-                    if suptop.contains((b1.atom, b2.atom)):
-                        safe = True
-                        break
-            if not safe:
-                break
-    if not safe:
+    # then the cycle should be present in both, left and right ligand.
+    # Every already matched neighbour of n1 (other than the parent) has to be paired
+    # with a matched neighbour of n2 (other than the parent), and vice versa,
+    # so the pairs reached from both sides have to be the same
+    atom_to_pair = suptop._atom_to_pair
+    closing_pairs_l = {atom_to_pair[b1.atom] for b1 in n1.bonds
+                       if b1.atom is not parent_n1 and b1.atom in atom_to_pair}
+    closing_pairs_r = {atom_to_pair[b2.atom] for b2 in n2.bonds
+                       if b2.atom is not parent_n2 and b2.atom in atom_to_pair}
+    if closing_pairs_l != closing_pairs_r:
+        # either only one of the nodes forms a cycle or both do but different cycles
         return None
 
     # check if the cycle spans multiple cycles present in the left and right molecule,
@@ -3030,7 +3171,7 @@ def _overlay(n1, n2, parent_n1, parent_n2, bond_types, suptop, ignore_coords=Fal
         logger.debug('Found a cycle spanning multiple cycles')
         return None
 
-    logger.debug(f"Adding {(n1, n2)} to suptop.matched_pairs")
+    logger.debug('Adding %s to suptop.matched_pairs', (n1, n2))
 
     # all looks good, create a new copy for this suptop
     suptop = copy.copy(suptop)
@@ -3070,7 +3211,13 @@ def _overlay(n1, n2, parent_n1, parent_n2, bond_types, suptop, ignore_coords=Fal
     # fixme: sort so that heavy atoms go first
     p1_bonds = n1.bonds.without(parent_n1)
     p2_bonds = n2.bonds.without(parent_n2)
-    candidate_pairings = list(itertools.product(p1_bonds, p2_bonds))
+    # only the bonded atoms of the same element can be paired,
+    # bin the right ones by the element and keep the order of itertools.product(p1_bonds, p2_bonds)
+    p2_bonds_by_element = {}
+    for n2_bond in p2_bonds:
+        p2_bonds_by_element.setdefault(n2_bond.atom.element, []).append(n2_bond)
+    candidate_pairings = [(n1_bond, n2_bond) for n1_bond in p1_bonds
+                          for n2_bond in p2_bonds_by_element.get(n1_bond.atom.element, ())]
 
     # check if any of the pairs have exactly the same location, use that as a hidden signal
     # it is possible at this stage to use predetermine the distances
@@ -3092,12 +3239,17 @@ def _overlay(n1, n2, parent_n1, parent_n2, bond_types, suptop, ignore_coords=Fal
     # but they will be considered as a group
     larger_suptops = []
     pairing_and_suptop = {}
+    node_ids = suptop._node_ids
     for n1_bond, n2_bond in candidate_pairings:
         # fixme - ideally we would allow other typing than just the chemical element
-        if n1_bond.atom.element is not n2_bond.atom.element:
+        # (the candidate pairings are already of the same element)
+
+        # the recursive call would reject the already matched atoms straight away,
+        # so do not create its frame (this is the most common case)
+        if id(n1_bond.atom) in node_ids or id(n2_bond.atom) in node_ids:
             continue
 
-        logger.debug(f'sampling {n1_bond}, {n2_bond}')
+        logger.debug('sampling %s, %s', n1_bond, n2_bond)
 
         # create a copy of the sup_top to allow for different traversals
         # fixme: note that you could just send bonds, and that would have both parent etc with a bit of work
@@ -3133,11 +3285,16 @@ def _overlay(n1, n2, parent_n1, parent_n2, bond_types, suptop, ignore_coords=Fal
 
     # sort in the descending order
     all_solutions.sort(key=lambda st: len(st), reverse=True)
+    # keep the first of the same solutions, the duplicates are marked and dropped in one pass
+    duplicate_ids = set()
     for sol1, sol2 in itertools.combinations(all_solutions, r=2):
+        if id(sol1) in duplicate_ids or id(sol2) in duplicate_ids:
+            continue
         if sol1.eq(sol2):
-            logger.debug(f"Found the same solution and removing, solution: {sol1.matched_pairs}")
-            if sol2 in all_solutions:
-                all_solutions.remove(sol2)
+            logger.debug('Found the same solution and removing, solution: %s', sol1.matched_pairs)
+            duplicate_ids.add(id(sol2))
+    if duplicate_ids:
+        all_solutions = [sol for sol in all_solutions if id(sol) not in duplicate_ids]
 
     best_suptop = extract_best_suptop(all_solutions, ignore_coords)
     return best_suptop
@@ -3227,9 +3384,8 @@ def superimpose_topologies(top1_nodes,
     # align the 3D coordinates before applying further changes
     # use the largest suptop to align the molecules
     if align_molecules and not ignore_coords:
-        def take_largest(x, y):
-            return x if len(x) > len(y) else y
-        reduce(take_largest, suptops).align_ligands_using_mcs()
+        # the last of the equally large suptops, as with the previous pairwise reduce
+        max(reversed(suptops), key=len).align_ligands_using_mcs()
         logger.debug(f'RMSD of the best overlay: {suptops[0].align_ligands_using_mcs():.2f}')
 
     # fixme - you might not need because we are now doing this on the way back
@@ -3325,9 +3481,7 @@ def superimpose_topologies(top1_nodes,
             logger.debug(f'Removed pairs because partial rings are not allowed {suptop._removed_because_unmatched_rings}')
 
     # remove the suptops that are empty
-    for st in suptops[::-1]:
-        if len(st) == 0:
-            suptops.remove(st)
+    suptops[:] = [st for st in suptops if len(st) != 0]
 
     if not disjoint_components:
         logger.debug(f'Checking for disjoint components in the {len(suptops)} suptops')
@@ -3395,12 +3549,125 @@ def superimpose_topologies(top1_nodes,
     return suptop
 
 
+def _fundamental_cycles(adjacency):
+    """
+    The cycle basis of an undirected graph given as the adjacency (node -> bonded nodes).
+
+    This walks a spanning tree of each connected component, like networkx.cycle_basis,
+    and closes a cycle with every back edge. It visits the nodes and the neighbours in the same order,
+    so it returns the same cycles, without the cost of creating the networkx graph for the small ligands.
+    """
+    unvisited = dict.fromkeys(adjacency)
+    cycles = []
+    while unvisited:
+        # walk one connected component
+        root = unvisited.popitem()[0]
+        stack = [root]
+        pred = {root: root}
+        used = {root: set()}
+        while stack:
+            z = stack.pop()
+            zused = used[z]
+            for nbr in adjacency[z]:
+                if nbr not in used:
+                    # a new node in the spanning tree
+                    pred[nbr] = z
+                    stack.append(nbr)
+                    used[nbr] = {z}
+                elif nbr not in zused:
+                    # a back edge closes a cycle, follow the tree back to where they meet
+                    pn = used[nbr]
+                    cycle = [nbr, z]
+                    p = pred[z]
+                    while p not in pn:
+                        cycle.append(p)
+                        p = pred[p]
+                    cycle.append(p)
+                    cycles.append(cycle)
+                    used[nbr].add(z)
+
+        for node in pred:
+            unvisited.pop(node, None)
+
+    return cycles
+
+
+def _nodes_in_cycles(adjacency):
+    """
+    The nodes that lie on any cycle of an undirected graph given as the adjacency (node -> bonded nodes).
+
+    A node is on a cycle when at least one of its edges is not a bridge, which is found with
+    the Tarjan's low-link depth-first search, so no cycle basis has to be created.
+    """
+    discovery = {}
+    low = {}
+    in_cycles = set()
+    for root in adjacency:
+        if root in discovery:
+            continue
+        discovery[root] = low[root] = len(discovery)
+        stack = [(root, None, iter(adjacency[root]))]
+        while stack:
+            node, parent, neighbours = stack[-1]
+            for nbr in neighbours:
+                if nbr is parent:
+                    continue
+                if nbr not in discovery:
+                    # descend along a new tree edge, the remaining neighbours are resumed afterwards
+                    discovery[nbr] = low[nbr] = len(discovery)
+                    stack.append((nbr, node, iter(adjacency[nbr])))
+                    break
+                # any other edge closes a cycle
+                low[node] = min(low[node], discovery[nbr])
+                in_cycles.add(node)
+                in_cycles.add(nbr)
+            else:
+                stack.pop()
+                if parent is not None:
+                    low[parent] = min(low[parent], low[node])
+                    # the tree edge is a bridge unless the subtree reaches above it
+                    if low[node] <= discovery[parent]:
+                        in_cycles.add(node)
+                        in_cycles.add(parent)
+
+    return in_cycles
+
+
+def _greedy_closest_assignment(positions_left, positions_right, allowed):
+    """
+    Repeatedly pair the closest left and right positions among the allowed combinations,
+    each left and each right position is used once.
+
+    :param positions_left: (N, 3) array
+    :param positions_right: (M, 3) array
+    :param allowed: (N, M) boolean array of the combinations that can be paired
+    :return: a list of (left index, right index, distance) for each of the N left positions, in the order picked
+    """
+    dsts = np.sqrt(np.sum(np.square(positions_left[:, None, :] - positions_right[None, :, :]), axis=2))
+    dsts[~allowed] = np.inf
+
+    assignment = []
+    for _ in range(len(positions_left)):
+        row, col = np.unravel_index(np.argmin(dsts), dsts.shape)
+        closest_dst = dsts[row, col]
+        if np.isinf(closest_dst):
+            raise Exception('The remaining atoms have no choices left to be matched with')
+        assignment.append((row, col, closest_dst))
+
+        # remove the left position from consideration and blacklist the right one
+        dsts[row, :] = np.inf
+        dsts[:, col] = np.inf
+
+    return assignment
+
+
 def calculate_rmsd(atom_pairs):
-    deviations = []
-    for atom1, atom2 in atom_pairs:
-        # check how far the atoms are to each other
-        deviations.append(atom1.position - atom2.position)
-    return np.sqrt(np.mean(((np.array(deviations)) ** 2)))
+    # check how far the atoms are to each other
+    positions = np.array([(atom1.position, atom2.position) for atom1, atom2 in atom_pairs], dtype='float32')
+    # the gathered array is already a fresh buffer, so reuse it for the deviations and their squares
+    deviations = np.subtract(positions[:, 0], positions[:, 1], out=positions[:, 0])
+    np.square(deviations, out=deviations)
+    return np.sqrt(deviations.mean())
 
 
 def extract_best_suptop(suptops, ignore_coords, weights=[1, 1], get_list=False):
@@ -3632,6 +3899,20 @@ def generate_nxg_from_list(atoms):
     return g
 
 
+def _adjacency_from_list(atoms):
+    """
+    Like generate_nxg_from_list, but the adjacency (node -> {bonded node: None}) without networkx,
+    with the nodes and the edges in the same order.
+    """
+    adjacency = {a: {} for a in atoms}
+    for a in atoms:
+        for a_bonded in a.bonds:
+            adjacency[a][a_bonded.atom] = None
+            adjacency.setdefault(a_bonded.atom, {})[a] = None
+
+    return adjacency
+
+
 def get_starting_configurations(left_atoms, right_atoms, fraction=0.2, filter_ring_c=True):
     """
         Minimise the number of starting configurations to optimise the process speed.
@@ -3649,8 +3930,8 @@ def get_starting_configurations(left_atoms, right_atoms, fraction=0.2, filter_ri
     TODO - ignore hydrogens?
     """
     logger.debug('Superimposition: optimising the search by narrowing down the starting configuration. ')
-    left_atoms_noh = list(filter(lambda a: a.element != 'H', left_atoms))
-    right_atoms_noh = list(filter(lambda a: a.element != 'H', right_atoms))
+    left_atoms_noh = [a for a in left_atoms if a.element != 'H']
+    right_atoms_noh = [a for a in right_atoms if a.element != 'H']
 
     # find out which atoms types are common across the two molecules
     # fixme - consider subclassing atom from MDAnalysis class and adding functions for some of these features
@@ -3659,12 +3940,13 @@ def get_starting_configurations(left_atoms, right_atoms, fraction=0.2, filter_ri
     right_types = {right_atom.type for right_atom in right_atoms_noh}
     common_types = left_types.intersection(right_types)
 
-    # for each atom type, check how many maximum atoms can theoretically be matched
+    # for each atom type, check how many maximum atoms can theoretically be matched,
+    # count all the types in one pass
+    left_count_by_type = Counter(left_atom.type for left_atom in left_atoms)
+    right_count_by_type = Counter(right_atom.type for right_atom in right_atoms)
     per_type_max_counter = {}
     for atom_type in common_types:
-        left_count_by_type = sum([1 for left_atom in left_atoms if left_atom.type == atom_type])
-        right_count_by_type = sum([1 for right_atom in right_atoms if right_atom.type == atom_type])
-        per_type_max_counter[atom_type] = min(left_count_by_type, right_count_by_type)
+        per_type_max_counter[atom_type] = min(left_count_by_type[atom_type], right_count_by_type[atom_type])
     max_overlap_size = sum(per_type_max_counter.values())
     logger.debug(f'Largest MCS size: {max_overlap_size}')
 
@@ -3674,34 +3956,35 @@ def get_starting_configurations(left_atoms, right_atoms, fraction=0.2, filter_ri
     # ignore carbons in cycles
     # fixme - we should not use this for macrocycles, which should be ignored here
     if filter_ring_c:
-        nxl = generate_nxg_from_list(left_atoms)
-        for cycle in nx.cycle_basis(nxl):
-            # ignore the carbons in the cycle
-            cycle_carbons = list(filter(lambda a: a.element == 'C', cycle))
-            logger.debug(f'Superimposition of left atoms: Ignoring carbons as starting configurations because '
-                  f'they are carbons in a cycle: {cycle_carbons}')
-            [left_atoms_starting.remove(a) for a in cycle_carbons if a in left_atoms_starting]
-        nxr = generate_nxg_from_list(right_atoms_starting)
-        for cycle in nx.cycle_basis(nxr):
-            # ignore the carbons in the cycle
-            cycle_carbons = list(filter(lambda a: a.element == 'C', cycle))
-            logger.debug(f'Superimposition of right atoms: Ignoring carbons as starting configurations because '
-                  f'they are carbons in a cycle: {cycle_carbons}')
-            [right_atoms_starting.remove(a) for a in cycle_carbons if a in right_atoms_starting]
-
-    # find out which atoms types are common across the two molecules
-    # fixme - consider subclassing atom from MDAnalysis class and adding functions for some of these features
-    # first, find the unique types for each molecule
-    left_types = {left_atom.type for left_atom in left_atoms_starting}
-    right_types = {right_atom.type for right_atom in right_atoms_starting}
-    common_types = left_types.intersection(right_types)
+        left_cycle_carbons = {a for a in _nodes_in_cycles(_adjacency_from_list(left_atoms)) if a.element == 'C'}
+        logger.debug('Superimposition of left atoms: Ignoring carbons as starting configurations because '
+                     'they are carbons in a cycle: %s', left_cycle_carbons)
+        right_cycle_carbons = {a for a in _nodes_in_cycles(_adjacency_from_list(right_atoms_starting))
+                               if a.element == 'C'}
+        logger.debug('Superimposition of right atoms: Ignoring carbons as starting configurations because '
+                     'they are carbons in a cycle: %s', right_cycle_carbons)
+        # remove them in one pass, keeping the order
+        left_atoms_starting = [a for a in left_atoms_starting if a not in left_cycle_carbons]
+        right_atoms_starting = [a for a in right_atoms_starting if a not in right_cycle_carbons]
+
+    # bin the atoms by their type in one pass (in the same order)
+    left_by_type = {}
+    for a in left_atoms_starting:
+        left_by_type.setdefault(a.type, []).append(a)
+    right_by_type = {}
+    for a in right_atoms_starting:
+        right_by_type.setdefault(a.type, []).append(a)
+
+    # find out which atoms types are common across the two molecules,
+    # the bins already hold the unique types of each molecule in the order of their first appearance
+    common_types = set(left_by_type).intersection(set(right_by_type))
 
     # for each atom type, check how many maximum atoms can theoretically be matched
     paired_by_type = []
     max_after_cycle_carbons = 0
     for atom_type in common_types:
-        picked_left = list(filter(lambda a: a.type == atom_type, left_atoms_starting))
-        picked_right = list(filter(lambda a: a.type == atom_type, right_atoms_starting))
+        picked_left = left_by_type[atom_type]
+        picked_right = right_by_type[atom_type]
         paired_by_type.append([picked_left, picked_right])
         max_after_cycle_carbons += min(len(picked_left), len(picked_right))
     logger.debug(f'Superimposition: simple max match of atoms after cycle carbons exclusion: {max_after_cycle_carbons}')
@@ -3719,12 +4002,13 @@ def get_starting_configurations(left_atoms, right_atoms, fraction=0.2, filter_ri
     added_counter = 0
     for rare_left_atoms, rare_right_atoms in sorted_paired_by_type:
         # starting_configurations
-        starting_configurations.extend(list(itertools.product(rare_left_atoms, rare_right_atoms)))
+        # every pairing of the type is kept, so extend straight from the lazy product
+        starting_configurations.extend(itertools.product(rare_left_atoms, rare_right_atoms))
         added_counter += min(len(rare_left_atoms), len(rare_right_atoms))
         if added_counter > desired_number_of_pairs:
             break
 
-    logger.debug(f'Superimposition: initial starting pairs for the search: {starting_configurations}')
+    logger.debug('Superimposition: initial starting pairs for the search: %s', starting_configurations)
     return starting_configurations
 
 
@@ -3763,12 +4047,25 @@ def _superimpose_topologies(top1_nodes, top2_nodes, mda1_nodes=None, mda2_nodes=
             logger.debug('Using heuristics to select the initial pairs for searching the maximum overlap.'
                   'Could produce non-optimal results.')
         else:
-            starting_node_pairs = list(itertools.product(top1_nodes, top2_nodes))
+            # _overlay rejects the pairs that differ in the element (or the type),
+            # so filter them out in one go before creating a SuperimposedTopology for each
+            left_nodes, right_nodes = list(top1_nodes), list(top2_nodes)
+            if use_general_type:
+                candidates = Atom.pairwise_same_element(left_nodes, right_nodes)
+            else:
+                candidates = Atom.pairwise_same_type(left_nodes, right_nodes)
+            starting_node_pairs = [(left_nodes[i], right_nodes[j]) for i, j in zip(*np.nonzero(candidates))]
             logger.debug('Checking all possible initial pairs to find the optimal MCS. ')
 
+    # the input topologies and their cycles are the same for every starting pair,
+    # so compute them once and start from a copy of the empty suptop
+    empty_suptop = SuperimposedTopology(list(top1_nodes), list(top2_nodes), mda1_nodes, mda2_nodes)
     for node1, node2 in starting_node_pairs:
         # with the given starting two nodes, generate the maximum common component
-        suptop = SuperimposedTopology(list(top1_nodes), list(top2_nodes), mda1_nodes, mda2_nodes)
+        suptop = copy.copy(empty_suptop)
+        # a copy keeps the id, so number each starting suptop as if it was created anew
+        suptop.id = SuperimposedTopology.COUNTER
+        SuperimposedTopology.COUNTER += 1
         # fixme turn into a property
         candidate_suptop = _overlay(node1, node2, parent_n1=None, parent_n2=None, bond_types=(None, None),
                                     suptop=suptop,
@@ -3808,16 +4105,15 @@ def _superimpose_topologies(top1_nodes, top2_nodes, mda1_nodes=None, mda2_nodes=
         # not be in the final list (we guarantee that each node is used only once)
         suptops.append(candidate_suptop)
 
-    # if there are only hydrogens superimposed without a connection to any heavy atoms, ignore these too
-    for suptop in suptops[::-1]:
-        all_hydrogens = True
-        for node1, _ in suptop.matched_pairs:
-            if not node1.type == 'H':
-                all_hydrogens = False
-                break
-        if all_hydrogens:
+    # if there are only hydrogens superimposed without a connection to any heavy atoms, ignore these too,
+    # keep the other suptops in a single pass
+    kept_suptops = []
+    for suptop in suptops:
+        if all(node1.type == 'H' for node1, _ in suptop.matched_pairs):
             logger.debug(f"Removing sup top because only hydrogens found {suptop.matched_pairs}")
-            suptops.remove(suptop)
+            continue
+        kept_suptops.append(suptop)
+    suptops[:] = kept_suptops
 
     # TEST: check that each node was used only once, fixme use only on the winner
     # for suptop in suptops:
@@ -3826,10 +4122,12 @@ def _superimpose_topologies(top1_nodes, top2_nodes, mda1_nodes=None, mda2_nodes=
     #     assert len(set(all_nodes)) == 2 * pair_count
 
     # TEST: check that the nodes on the left are always from topology 1 and the nodes on the right are always from top2
+    # the atoms are equal only to themselves, so test against the sets built once
+    top1_nodes_set, top2_nodes_set = set(top1_nodes), set(top2_nodes)
     for suptop in suptops:
         for node1, node2 in suptop.matched_pairs:
-            assert node1 in list(top1_nodes)
-            assert node2 in list(top2_nodes)
+            assert node1 in top1_nodes_set
+            assert node2 in top2_nodes_set
 
     # clean the overlays by removing sub_overlays.
     # ie if all atoms in an overlay are found to be a bigger part of another overlay,
@@ -4035,26 +4333,26 @@ def get_atoms_bonds_from_ac(ac_file):
     # 1) a dictionary with charges, e.g. Item: "C17" : -0.222903
     # 2) a list of bonds
 
-    ac_lines = open(ac_file).readlines()
+    with open(ac_file) as ac:
+        ac_lines = ac.readlines()
 
     # fixme - hide hydrogens
     # ac_lines = filter(lambda l:not('h' in l or 'H' in l), ac_lines)
 
     # extract the atoms
     # ATOM      1  C17 MOL     1      -5.179  -2.213   0.426 -0.222903        ca
-    atom_lines = filter(lambda l: l.startswith('ATOM'), ac_lines)
+    atom_fields = [line.split() for line in ac_lines if line.startswith('ATOM')]
+
+    # convert the coordinates in one go, each atom holds a view of its row
+    positions = np.array([fields[5:8] for fields in atom_fields], dtype=np.float64).astype('float32').reshape(-1, 3)
 
     atoms = []
-    for line in atom_lines:
-        atom_phrase, atom_id, atom_name, res_name, res_id, x, y, z, charge, atom_colloq = line.split()
-        x, y, z = float(x), float(y), float(z)
-        charge = float(charge)
-        res_id = int(res_id)
-        atom_id = int(atom_id)
+    for fields, position in zip(atom_fields, positions):
+        atom_phrase, atom_id, atom_name, res_name, res_id, x, y, z, charge, atom_colloq = fields
         atom = Atom(name=atom_name, atom_type=atom_colloq)
-        atom.charge = charge
-        atom.id = atom_id
-        atom.position = (x, y, z)
+        atom.charge = float(charge)
+        atom.id = int(atom_id)
+        atom.position = position
         atom.resname = res_name
         atoms.append(atom)
 
@@ -4063,9 +4361,8 @@ def get_atoms_bonds_from_ac(ac_file):
     # extract the bonds, e.g.
     #     bondID atomFrom atomTo ????
     # BOND    1    1    2    7    C17  C18
-    bond_lines = filter(lambda l: l.startswith('BOND'), ac_lines)
     bonds = [(int(bondFrom), int(bondTo)) for _, bondID, bondFrom, bondTo, something, atomNameFrom, atomNameTo in
-             [left.split() for left in bond_lines]]
+             (line.split() for line in ac_lines if line.startswith('BOND'))]
 
     return atoms, bonds
 
@@ -4086,7 +4383,9 @@ def get_atoms_bonds_from_mol2(ref_filename, mob_filename, use_general_type=True)
         # convert the Parmed atoms into Atom objects.
         """
         atoms = []
-        for parmed_atom in parmed_atoms:
+        # keep the coordinates in one contiguous block, each atom holds a view of its row
+        positions = np.array([[a.xx, a.xy, a.xz] for a in parmed_atoms], dtype='float32')
+        for parmed_atom, position in zip(parmed_atoms, positions):
             atom_type = parmed_atom.type
             # atom type might be empty if
             if not atom_type:
@@ -4101,7 +4400,7 @@ def get_atoms_bonds_from_mol2(ref_filename, mob_filename, use_general_type=True)
                 atom = Atom(name=parmed_atom.name, atom_type=atom_type, charge=0.0, use_general_type=use_general_type)
                 logger.warning('One of the input files is missing charges. Setting the charge to 0')
             atom.id = parmed_atom.idx
-            atom.position = [parmed_atom.xx, parmed_atom.xy, parmed_atom.xz]
+            atom.position = position
             atom.resname = parmed_atom.residue.name
             atoms.append(atom)
         return atoms
@@ -4128,15 +4427,16 @@ def assign_coords_from_pdb(atoms, pdb_atoms):
     :param pdb_atoms: atoms loaded with ParmEd with the coordinates to be used
 
     """
+    # index the .pdb atoms by their name once, the first atom with a given name is used
+    pdb_atoms_by_name = {}
+    for pdb_atom in pdb_atoms.atoms:
+        pdb_atoms_by_name.setdefault(pdb_atom.name.upper(), pdb_atom)
+
     for atom in atoms:
         # find the corresponding atom
-        found_match = False
-        for pdb_atom in pdb_atoms.atoms:
-            if pdb_atom.name.upper() == atom.name.upper():
-                # charges?
-                atom.position = (pdb_atom.xx, pdb_atom.xy, pdb_atom.xz)
-                found_match = True
-                break
-        if not found_match:
+        pdb_atom = pdb_atoms_by_name.get(atom.name.upper())
+        if pdb_atom is None:
             logger.error(f"Did not find atom? {atom.name}")
             raise Exception("wait a minute")
+        # charges?
+        atom.position = (pdb_atom.xx, pdb_atom.xy, pdb_atom.xz)